@@ -0,0 +1,34 @@
+from typing import NamedTuple, Tuple
+from enum import Enum
+
+class ActionType(Enum):
+    MOVE = "move"         # Move the piece on source to target
+    BUY = "buy"           # Buy a piece of piece_kind with the region holding source and place it on target
+    UPGRADE = "upgrade"   # Raise the level of the soldier on source by one, paid by its region
+    END_TURN = "end_turn"
+
+class Action(NamedTuple):
+    '''
+    A single action of the team whose turn it is. Regions are referred to by any of their tiles,
+    since region ids change when regions merge or split.
+    '''
+    type: ActionType
+    source: Tuple[int, int] = None
+    target: Tuple[int, int] = None
+    piece_kind: int = 0
+
+END_TURN = Action(ActionType.END_TURN)
+
+def action_to_list(action: Action) -> list:
+    # Plain list form of an action, e.g. for JSON messages
+    return [action.type.value,
+            None if action.source is None else list(action.source),
+            None if action.target is None else list(action.target),
+            action.piece_kind]
+
+def action_from_list(data: list) -> Action:
+    action_type, source, target, piece_kind = data
+    return Action(ActionType(action_type),
+                  None if source is None else tuple(source),
+                  None if target is None else tuple(target),
+                  int(piece_kind))
@@ -1,6 +1,8 @@
 from abc import ABC, abstractmethod
 from typing import Tuple
 from piece import Piece
+from action import Action, END_TURN
+import numpy as np
 
 class Agent(ABC):
 
@@ -11,4 +13,20 @@ class Agent(ABC):
         pass
     
     def place_piece(self, tile_coord: Tuple[int, int], piece: Piece) -> None:
-        pass
\ No newline at end of file
+        pass
+
+    def select_action(self, game) -> Action:
+        # Choose the next action for game.current_team, the turn ends on END_TURN
+        return END_TURN
+
+class RandomAgent(Agent):
+    '''
+    Plays a uniformly random legal action, ending its turn whenever END_TURN is drawn.
+    '''
+
+    def __init__(self, seed: int = None):
+        self.rng = np.random.default_rng(seed)
+
+    def select_action(self, game) -> Action:
+        actions = game.legal_actions()
+        return actions[self.rng.integers(len(actions))]
@@ -0,0 +1,44 @@
+'''
+Stand-in agent process for the socket protocol in async_agent.py. Connects back to the game at
+host:port and answers every request, picking a random legal action. A delay can be added to
+every answer to try out deadlines.
+
+    python agent_server.py HOST PORT [--seed SEED] [--delay SECONDS]
+'''
+
+from piece import Soldier1
+from action import END_TURN, action_to_list
+import argparse
+import asyncio
+import json
+import random
+
+async def serve(host: str, port: int, seed: int = None, delay: float = 0.0) -> None:
+    rng = random.Random(seed)
+    reader, writer = await asyncio.open_connection(host, port)
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        request = json.loads(line)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if request["method"] == "select_action":
+            legal = request["legal"]
+            result = rng.choice(legal) if legal else action_to_list(END_TURN)
+        elif request["method"] == "select_piece":
+            result = Soldier1.kind
+        else:
+            result = None
+        writer.write((json.dumps({"id": request["id"], "result": result}) + "\n").encode())
+        await writer.drain()
+    writer.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Random agent speaking the slay agent socket protocol")
+    parser.add_argument("host")
+    parser.add_argument("port", type=int)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--delay", type=float, default=0.0)
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port, args.seed, args.delay))
@@ -0,0 +1,124 @@
+'''
+Binary archive of boards. A file holds a fixed size header followed by any number of
+fixed width records, one per board, so an archive can be opened with np.memmap without any
+parsing and only the pages of the boards which are read get touched.
+
+Every record holds the full game state of each cell: activity, team, piece kind, region and
+whether the soldier on the cell has already moved this turn, along with whose turn it is.
+Regions are numbered 0, 1, ... in the record and their balances are kept once per region in a
+table with room for one region per cell. All boards of one archive share the board size
+stored in the header.
+'''
+
+from typing import Iterable, Tuple
+from pathlib import Path
+from tile import TileType
+import numpy as np
+
+MAGIC = b"SLAYMAP"
+FORMAT_VERSION = 3
+HEADER_SIZE = 64
+HEADER_DTYPE = np.dtype([("magic", "S8"),
+                         ("version", "<u4"),
+                         ("rows", "<u4"),
+                         ("cols", "<u4"),
+                         ("tile_type", "S16"),
+                         ("count", "<u8"),
+                         ("reserved", "V20")])
+
+def record_dtype(size: Tuple[int, int]) -> np.dtype:
+    num_cells = size[0] * size[1]
+    region_type = "<i2" if num_cells <= np.iinfo(np.int16).max else "<i4"
+    return np.dtype([("active", "?", size),
+                     ("team", "i1", size),
+                     ("piece", "u1", size),
+                     ("region_id", region_type, size), # Region number of every cell, -1 if none
+                     ("moved", "?", size),
+                     ("balance", "<i4", (num_cells,)), # Balance of every region by number
+                     ("num_regions", "<i4"),
+                     ("num_players", "<i4"),
+                     ("current_team", "<i4"),
+                     ("turn", "<i4")])
+
+def make_header(size: Tuple[int, int], tile_type: TileType, count: int = 0) -> np.ndarray:
+    header = np.zeros((), dtype=HEADER_DTYPE)
+    header["magic"] = MAGIC
+    header["version"] = FORMAT_VERSION
+    header["rows"], header["cols"] = size
+    header["tile_type"] = tile_type.value.encode()
+    header["count"] = count
+    return header
+
+def read_header(path: str) -> np.ndarray:
+    header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+    if len(header) == 0 or header[0]["magic"] != MAGIC:
+        raise ValueError(f"{path} is not a map archive!")
+    if header[0]["version"] != FORMAT_VERSION:
+        raise ValueError(f"{path} has map archive version {header[0]['version']}, expected {FORMAT_VERSION}!")
+    return header[0]
+
+def header_size(header: np.ndarray) -> Tuple[int, int]:
+    return (int(header["rows"]), int(header["cols"]))
+
+def header_tile_type(header: np.ndarray) -> TileType:
+    return TileType(header["tile_type"].decode())
+
+def encode_board(board, regions: dict = None, num_players: int = 0, current_team: int = 0, turn: int = 0,
+                 moved: Iterable[Tuple[int, int]] = ()) -> np.ndarray:
+    # Pack a board, and optionally the balances of its regions and the turn state, into a single
+    # record. Regions are renumbered in order of their ids.
+    record = np.zeros((), dtype=record_dtype(board.size))
+    record["active"] = board.grid(board.active)
+    record["team"] = board.grid(board.team)
+    record["piece"] = board.grid(board.piece)
+    in_region = board.region_id != board.NO_REGION
+    region_ids, numbers = np.unique(board.region_id[in_region], return_inverse=True)
+    region_number = np.full(len(board), -1, dtype=np.int64)
+    region_number[in_region] = numbers
+    record["region_id"] = board.grid(region_number)
+    record["num_regions"] = len(region_ids)
+    if regions:
+        record["balance"][:len(region_ids)] = [regions[int(region_id)].get_balance() for region_id in region_ids]
+    moved = list(moved)
+    if moved:
+        record["moved"].reshape(-1)[board.indices(moved)] = True
+    record["num_players"] = num_players
+    record["current_team"] = current_team
+    record["turn"] = turn
+    return record
+
+def decode_board(record: np.ndarray, board) -> None:
+    # Copy the cells of a record into a board of the same size. The region numbers of the record
+    # become the region ids.
+    board.active[:] = record["active"].ravel()
+    board.team[:] = record["team"].ravel()
+    board.piece[:] = record["piece"].ravel()
+    board.region_id[:] = np.where(record["region_id"].ravel() >= 0, record["region_id"].ravel(), board.NO_REGION)
+
+def append_records(path: str, size: Tuple[int, int], tile_type: TileType, records: np.ndarray) -> int:
+    # Append records to an archive, creating it if necessary. Returns the index of the first record.
+    path = Path(path)
+    records = np.asarray(records, dtype=record_dtype(size)).reshape(-1)
+    if not path.exists():
+        with open(path, "wb") as f:
+            header = make_header(size, tile_type)
+            f.write(header.tobytes().ljust(HEADER_SIZE, b"\x00"))
+    header = read_header(path)
+    if header_size(header) != tuple(size) or header_tile_type(header) != tile_type:
+        raise ValueError(f"Cannot add {tile_type.value} boards of size {size} to archive {path} of size {header_size(header)}!")
+    first = int(header["count"])
+    with open(path, "r+b") as f:
+        f.seek(HEADER_SIZE + first * records.dtype.itemsize)
+        f.write(records.tobytes())
+        f.seek(0)
+        f.write(make_header(size, tile_type, first + len(records)).tobytes())
+    return first
+
+def open_archive(path: str, mode: str = "r") -> np.memmap:
+    # Memory map every record of an archive, nothing is read until a record is accessed
+    header = read_header(path)
+    size = header_size(header)
+    count = int(header["count"])
+    if count == 0:
+        return np.zeros(0, dtype=record_dtype(size))
+    return np.memmap(path, dtype=record_dtype(size), mode=mode, offset=HEADER_SIZE, shape=(count,))
@@ -0,0 +1,196 @@
+'''
+Asynchronous agents, so that slow or remote agents do not block rendering or other games.
+
+AsyncAgent mirrors Agent with awaitable methods. Local agents are wrapped with
+ThreadedAgent, which runs them on a worker thread. RemoteAgent talks to an agent in another
+process over a local socket. Messages are JSON objects, one per line:
+
+    request     {"id": 3, "method": "select_action", "team": 0, "turn": 5, "legal": [...]}
+    response    {"id": 3, "result": ["move", [4, 2], [5, 2], 0]}
+
+Every call has a deadline. An agent which misses it forfeits the move: select_action ends the
+turn, and a late response is dropped. RemoteAgent enforces its own deadline per call, and
+play_game_async holds every agent to a deadline per move, local ones included. agent_server.py
+is a stand-in agent process speaking this protocol.
+'''
+
+from abc import ABC
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from pathlib import Path
+from piece import Piece, piece_from_kind
+from action import Action, ActionType, END_TURN, action_to_list, action_from_list
+from agent import Agent
+from map import Map
+from game import Game
+import asyncio
+import json
+import sys
+
+class AsyncAgent(ABC):
+
+    def __init__(self):
+        pass
+
+    async def select_piece(self, tile_coord: Tuple[int, int]) -> Piece:
+        pass
+
+    async def place_piece(self, tile_coord: Tuple[int, int], piece: Piece) -> None:
+        pass
+
+    async def select_action(self, game) -> Action:
+        return END_TURN
+
+    async def close(self) -> None:
+        pass
+
+class ThreadedAgent(AsyncAgent):
+    '''
+    Runs a synchronous Agent on a worker thread. The agent works on a copy of the game, so the
+    game can go on while a call which missed its deadline is still running.
+    '''
+
+    def __init__(self, agent: Agent):
+        self.agent = agent
+
+    async def select_piece(self, tile_coord: Tuple[int, int]) -> Piece:
+        return await asyncio.get_running_loop().run_in_executor(None, self.agent.select_piece, tile_coord)
+
+    async def place_piece(self, tile_coord: Tuple[int, int], piece: Piece) -> None:
+        await asyncio.get_running_loop().run_in_executor(None, self.agent.place_piece, tile_coord, piece)
+
+    async def select_action(self, game) -> Action:
+        map = game.get_map()
+        snapshot = Game.from_record(Map(size=map.get_size(), tile_type=map.get_tile_type()), game.to_record())
+        return await asyncio.get_running_loop().run_in_executor(None, self.agent.select_action, snapshot)
+
+class RemoteAgent(AsyncAgent):
+    '''
+    Agent in another process, reached over a stream. Responses are matched to requests by id,
+    so a response arriving after its deadline is simply dropped.
+    '''
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                 deadline: float = 1.0, process: asyncio.subprocess.Process = None):
+        self.reader = reader
+        self.writer = writer
+        self.deadline = deadline
+        self.process = process
+        self.next_id = 0
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.missed_deadlines = 0
+        self.receiver = asyncio.ensure_future(self.receive())
+
+    async def receive(self) -> None:
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            message = json.loads(line)
+            future = self.pending.pop(message["id"], None)
+            if future is not None and not future.done():
+                future.set_result(message.get("result"))
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("Remote agent closed the connection!"))
+
+    async def call(self, method: str, **params):
+        # Send a request and wait for its result until the deadline, raises asyncio.TimeoutError
+        request_id = self.next_id
+        self.next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        self.writer.write((json.dumps({"id": request_id, "method": method, **params}) + "\n").encode())
+        await self.writer.drain()
+        try:
+            return await asyncio.wait_for(future, self.deadline)
+        except asyncio.TimeoutError:
+            self.pending.pop(request_id, None)
+            self.missed_deadlines += 1
+            raise
+
+    async def select_piece(self, tile_coord: Tuple[int, int]) -> Piece:
+        try:
+            return piece_from_kind(await self.call("select_piece", tile_coord=list(tile_coord)))
+        except asyncio.TimeoutError:
+            return None
+
+    async def place_piece(self, tile_coord: Tuple[int, int], piece: Piece) -> None:
+        try:
+            await self.call("place_piece", tile_coord=list(tile_coord), piece_kind=piece.kind)
+        except asyncio.TimeoutError:
+            pass
+
+    async def select_action(self, game) -> Action:
+        legal = game.legal_actions()
+        try:
+            result = await self.call("select_action", team=game.current_team, turn=game.turn,
+                                     legal=[action_to_list(action) for action in legal])
+        except asyncio.TimeoutError:
+            return END_TURN
+        return action_from_list(result)
+
+    async def close(self) -> None:
+        self.writer.close()
+        self.receiver.cancel()
+        if self.process is not None:
+            try:
+                await asyncio.wait_for(self.process.wait(), self.deadline)
+            except asyncio.TimeoutError:
+                self.process.kill()
+                await self.process.wait()
+
+async def spawn_agent(*args: str, deadline: float = 1.0, host: str = "127.0.0.1") -> RemoteAgent:
+    # Start the stand-in agent server in a subprocess and connect to it over a local socket.
+    # Extra args are passed to agent_server.py.
+    connected = asyncio.get_running_loop().create_future()
+    async def on_connect(reader, writer):
+        if not connected.done():
+            connected.set_result((reader, writer))
+    server = await asyncio.start_server(on_connect, host, 0)
+    port = server.sockets[0].getsockname()[1]
+    process = await asyncio.create_subprocess_exec(sys.executable, str(Path(__file__).with_name("agent_server.py")),
+                                                   host, str(port), *args)
+    try:
+        reader, writer = await asyncio.wait_for(connected, 10 * deadline + 5)
+    finally:
+        server.close()
+    return RemoteAgent(reader, writer, deadline=deadline, process=process)
+
+async def await_action(agent: AsyncAgent, game, deadline: float = None, on_wait: Callable[[], None] = None,
+                        wait_interval: float = 1/60) -> Action:
+    # Ask an agent for its action, calling on_wait every wait_interval seconds while it thinks. An
+    # agent which does not answer within deadline seconds forfeits the move and the turn ends.
+    # A ThreadedAgent can not be stopped, its late answer on its copy of the game is dropped.
+    loop = asyncio.get_running_loop()
+    task = asyncio.ensure_future(agent.select_action(game))
+    end = None if deadline is None else loop.time() + deadline
+    while True:
+        timeout = wait_interval if end is None else max(min(wait_interval, end - loop.time()), 0)
+        done, _ = await asyncio.wait({task}, timeout=timeout)
+        if done:
+            return task.result()
+        if end is not None and loop.time() >= end:
+            task.cancel()
+            return END_TURN
+        if on_wait is not None:
+            on_wait()
+
+async def play_game_async(game, agents: Sequence[AsyncAgent], max_turns: int = 100, max_actions: int = 100,
+                          on_wait: Callable[[], None] = None, wait_interval: float = 1/60,
+                          deadline: float = 1.0) -> Optional[int]:
+    # Play a game with asynchronous agents. While an agent is thinking, on_wait is called every
+    # wait_interval seconds (e.g. to draw a frame), and other tasks on the event loop keep running.
+    # Every move has the same deadline for all agents, None for no limit. Returns the winning
+    # team, or None if the game was not decided.
+    while not game.is_over() and game.turn < max_turns:
+        agent = agents[game.current_team]
+        for _ in range(max_actions):
+            action = await await_action(agent, game, deadline, on_wait, wait_interval)
+            if action.type == ActionType.END_TURN or not game.apply(action):
+                break
+        game.end_turn()
+    return game.get_winner()
+
+async def play_games_async(games: Sequence, agents: Sequence[Sequence[AsyncAgent]], **kwargs) -> List[Optional[int]]:
+    # Play several games at once, each one advancing whenever its agents answer
+    return await asyncio.gather(*[play_game_async(game, game_agents, **kwargs) for game, game_agents in zip(games, agents)])
@@ -0,0 +1,118 @@
+from typing import Set, Tuple
+from tile import Tile, TileType
+from piece import PIECE_TYPES
+from journal import Journal
+import numpy as np
+
+# Power of each piece kind, indexed by the kind codes stored on the board
+PIECE_POWER = np.zeros(max(PIECE_TYPES) + 1, dtype=np.int8)
+for kind, piece_type in PIECE_TYPES.items():
+    PIECE_POWER[kind] = piece_type.power
+
+class Board:
+    '''
+    Compact array representation of the cells of a map. Every cell is addressed by a flat
+    index (row * cols + col) into a set of NumPy arrays, and Tile objects are lightweight
+    views into these arrays which are created on demand.
+    '''
+
+    NO_REGION = -1
+
+    def __init__(self, size: Tuple[int, int] = (1, 1), tile_type: TileType = TileType.HEXAGON):
+        self.size = size # size in (rows, cols)
+        self.tile_type = tile_type
+        num_cells = size[0] * size[1]
+
+        self.active = np.ones(num_cells, dtype=bool)
+        self.team = np.full(num_cells, -1, dtype=np.int8)
+        self.region_id = np.full(num_cells, Board.NO_REGION, dtype=np.int64)
+        self.piece = np.zeros(num_cells, dtype=np.uint8) # Piece kind on each cell, 0 for no piece
+        self.changed: Set[int] = set() # Cells whose team or piece changed, consumed by the move generator
+        self.journal = Journal() # Records how to revert changes while Game.make is running
+
+        # (N, k) table of neighboring flat indices, -1 marks a neighbor which is off the board
+        self.tile_constructor = Tile.get_tile_constructor(tile_type)
+        self.neighbors = self.tile_constructor.make_neighbor_table(size)
+        self.closed_neighbors = np.concatenate([np.arange(num_cells)[:, None], self.neighbors], axis=1)
+
+        # (teams, N) strongest power among each team's pieces on or next to each cell, the
+        # protection a cell of that team gets against captures. None until track_defense is called.
+        self.defense = None
+
+        # Incremental Zobrist hash of the teams and pieces of all cells, see zobrist.py. The key
+        # each cell currently contributes is kept so a change only needs the cell's new state.
+        self.zobrist = None
+        self.cell_hash = None
+        self.hash = 0
+
+    def bind(self, active: np.ndarray, team: np.ndarray, region_id: np.ndarray, piece: np.ndarray) -> None:
+        # Keep the cell state in the given arrays from now on, e.g. rows of arrays stacked over many
+        # boards. The current state is copied over.
+        active[:], team[:], region_id[:], piece[:] = self.active, self.team, self.region_id, self.piece
+        self.active, self.team, self.region_id, self.piece = active, team, region_id, piece
+
+    def __len__(self):
+        return self.size[0] * self.size[1]
+
+    def index(self, coord: Tuple[int, int]) -> int:
+        return coord[0] * self.size[1] + coord[1]
+
+    def indices(self, coords) -> np.ndarray:
+        coords = np.asarray(coords, dtype=np.int64).reshape(-1, 2)
+        return coords[:, 0] * self.size[1] + coords[:, 1]
+
+    def coord(self, index: int) -> Tuple[int, int]:
+        row, col = divmod(int(index), self.size[1])
+        return (row, col)
+
+    def set_region_ids(self, indices: np.ndarray, region_ids: np.ndarray) -> None:
+        self.journal.record(self.set_region_ids, indices, self.region_id[indices])
+        self.region_id[indices] = region_ids
+
+    def get_tile(self, coord: Tuple[int, int]) -> Tile:
+        return self.tile_constructor(self, coord)
+
+    def grid(self, values: np.ndarray) -> np.ndarray:
+        # View a flat per-cell array as (rows, cols)
+        return values.reshape(self.size)
+
+    def track_defense(self, num_teams: int) -> None:
+        self.defense = np.zeros((num_teams, len(self)), dtype=np.int8)
+        self.update_defense(np.arange(len(self)))
+
+    def update_defense(self, indices: np.ndarray) -> None:
+        # Recompute the defense of the given cells from the pieces on and around them
+        around = self.closed_neighbors[indices]
+        on_board = around >= 0
+        power = np.where(on_board, PIECE_POWER[self.piece[around]], 0)
+        team = np.where(on_board & self.active[around], self.team[around], -1)
+        for defending_team in range(len(self.defense)):
+            self.defense[defending_team, indices] = np.where(team == defending_team, power, 0).max(axis=1)
+
+    def track_hash(self, keys) -> None:
+        self.zobrist = keys
+        self.cell_hash = keys.cell_keys(self.team, self.piece)
+        self.hash = int(np.bitwise_xor.reduce(self.cell_hash))
+
+    def touch(self, index: int) -> None:
+        # Record that the team or piece of a cell changed. Only the cell and its neighbors can
+        # have a different defense afterwards.
+        self.changed.add(index)
+        if self.defense is not None:
+            around = self.closed_neighbors[index]
+            self.update_defense(around[around >= 0])
+        if self.zobrist is not None:
+            key = self.zobrist.team[index, self.team[index] + 1] ^ self.zobrist.piece[index, self.piece[index]]
+            self.hash ^= int(self.cell_hash[index] ^ key)
+            self.cell_hash[index] = key
+
+    def protection(self, indices) -> np.ndarray:
+        # Defense of cells against captures, taken from the pieces of the team which owns them
+        team = self.team[indices]
+        return np.where(team >= 0, self.defense[np.maximum(team, 0), indices], 0)
+
+    def attackable(self, team: int, power: int) -> np.ndarray:
+        # Mask of the cells of other teams which a soldier of team with the given power could take,
+        # ignoring whether they border one of the team's regions
+        indices = np.arange(len(self))
+        return self.active & (self.team != team) & (self.protection(indices) < power)
@@ -0,0 +1,62 @@
+from typing import List
+import numpy as np
+
+def neighbor_edges(neighbors: np.ndarray):
+    # Every edge of a neighbor table listed once, as arrays of source and target indices
+    sources = np.repeat(np.arange(len(neighbors)), neighbors.shape[1])
+    targets = neighbors.ravel()
+    keep = targets > sources
+    return sources[keep], targets[keep]
+
+def label_edges(num_cells: int, sources: np.ndarray, targets: np.ndarray) -> np.ndarray:
+    # Vectorized union-find: hook the larger root of every edge onto the smaller one, then
+    # compress paths until every cell points at its root. Edges whose ends already share a
+    # root can never separate again, so they are dropped from the next sweep. Every cell ends up
+    # labelled with the smallest index in its component.
+    labels = np.arange(num_cells)
+    while len(sources) > 0:
+        source_labels, target_labels = labels[sources], labels[targets]
+        unmerged = source_labels != target_labels
+        sources, targets = sources[unmerged], targets[unmerged]
+        if len(sources) == 0:
+            break
+        source_labels, target_labels = source_labels[unmerged], target_labels[unmerged]
+        np.minimum.at(labels, np.maximum(source_labels, target_labels), np.minimum(source_labels, target_labels))
+        while True:
+            compressed = labels[labels]
+            if np.array_equal(compressed, labels):
+                break
+            labels = compressed
+    return labels
+
+class Components:
+    '''
+    Labels the connected components of same-team land on a Board. Every active cell gets the
+    label of the smallest flat index in its component, inactive cells are labelled -1.
+    '''
+
+    def __init__(self, board):
+        self.board = board
+        self.labels = np.full(len(board), -1, dtype=np.int64)
+        self.adjacency = board.neighbors.tolist()
+
+    def same_team_edges(self):
+        # Every edge between two active neighboring cells of the same team, listed once
+        board = self.board
+        sources, targets = neighbor_edges(board.neighbors)
+        keep = board.active[sources] & board.active[targets] & (board.team[sources] == board.team[targets])
+        return sources[keep], targets[keep]
+
+    def label_all(self) -> np.ndarray:
+        sources, targets = self.same_team_edges()
+        labels = label_edges(len(self.board), sources, targets)
+        labels[~self.board.active] = -1
+        self.labels = labels
+        return labels
+
+    def groups(self) -> List[np.ndarray]:
+        # Flat indices of every component, ordered by label
+        active = np.flatnonzero(self.labels >= 0)
+        order = active[np.argsort(self.labels[active], kind="stable")]
+        _, starts = np.unique(self.labels[order], return_index=True)
+        return np.split(order, starts[1:])
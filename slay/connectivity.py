@@ -0,0 +1,87 @@
+from typing import Iterable, List, Optional, Tuple
+from collections import deque
+import numpy as np
+
+class Connectivity:
+    '''
+    Answers connectivity queries between cells of one team, e.g. whether two cells are still
+    connected after a cell was taken by another team. A search is started from every query cell
+    at once and the smallest search is always expanded next, so a query stops as soon as the
+    searches meet or every side but one has been exhausted. The cost grows with the smaller
+    sides rather than the whole region.
+    '''
+
+    def __init__(self, board, team: int):
+        self.board = board
+        self.team = team
+        self.adjacency = board.neighbors.tolist()
+
+    def is_member(self, index: int) -> bool:
+        return self.board.active[index] and self.board.team[index] == self.team
+
+    def split(self, seeds: Iterable[int], removed: int = None) -> Tuple[List[np.ndarray], Optional[int]]:
+        # Returns the components which were fully explored (the smaller sides), and a seed in the
+        # one remaining component which was not explored to the end, or None if every component
+        # was. When all seeds are connected, no components are returned.
+        seeds = [int(seed) for seed in seeds if self.is_member(seed) and seed != removed]
+        if len(seeds) == 0:
+            return [], None
+
+        owner = {}
+        parent = []
+        queues = []
+        members = []
+
+        def find(search: int) -> int:
+            while parent[search] != search:
+                parent[search] = parent[parent[search]]
+                search = parent[search]
+            return search
+
+        def union(first: int, second: int) -> int:
+            # Merge the smaller search into the larger one
+            if len(members[first]) < len(members[second]):
+                first, second = second, first
+            parent[second] = first
+            members[first].extend(members[second])
+            queues[first].extend(queues[second])
+            members[second], queues[second] = [], deque()
+            return first
+
+        roots = set()
+        for seed in seeds:
+            if seed in owner:
+                continue
+            owner[seed] = len(parent)
+            parent.append(len(parent))
+            queues.append(deque([seed]))
+            members.append([seed])
+            roots.add(owner[seed])
+
+        while len(roots) > 1:
+            unfinished = [root for root in roots if queues[root]]
+            if len(unfinished) <= 1:
+                break
+            root = min(unfinished, key=lambda search: len(members[search]))
+            index = queues[root].popleft()
+            for neighbor in self.adjacency[index]:
+                if neighbor < 0 or neighbor == removed or not self.is_member(neighbor):
+                    continue
+                other = owner.get(neighbor)
+                if other is None:
+                    owner[neighbor] = root
+                    members[root].append(neighbor)
+                    queues[root].append(neighbor)
+                else:
+                    other = find(other)
+                    if other != root:
+                        roots.discard(root)
+                        roots.discard(other)
+                        root = union(root, other)
+                        roots.add(root)
+
+        if len(roots) == 1:
+            return [], None
+        pieces = [np.sort(np.array(members[root])) for root in roots if not queues[root]]
+        rest = [members[root][0] for root in roots if queues[root]]
+        return pieces, rest[0] if rest else None
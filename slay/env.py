@@ -0,0 +1,159 @@
+'''
+Batched environment for reinforcement learning: N games stepped in lockstep. The cells of all
+boards live in stacked (N, cells) arrays which every game's board uses as its storage, so
+observations and rewards are computed on whole stacks at once. Finished games are replaced by
+games on newly generated maps.
+
+Every step applies one action per game for the team to move. Invalid actions end the turn. The
+reward of the acting team is the change in its share of the land, plus 1 if the action won the
+game. A game is done once it is won or max_turns rounds were played.
+
+BatchEnv has a sequential reference path which handles one game at a time and a fast path
+which works on the stacks, and both produce the same observations, rewards and done flags bit
+for bit. Resets are seeded from (base_seed, reset number) only, so a run does not depend on the
+path taken. The games draw from np.random, so the environment keeps its own np.random state and
+swaps it in while it runs, which leaves the caller's random state alone.
+'''
+
+from typing import List, Sequence, Tuple
+from tile import TileType
+from map import Map
+from mapgen import MapGenerator, map_rng
+from board import Board
+from game import Game
+from action import Action, END_TURN
+from observation import ObservationEncoder
+import numpy as np
+
+class BatchEnv:
+
+    def __init__(self, num_envs: int,
+                       size: Tuple[int, int] = (20, 10),
+                       num_players: int = 2,
+                       land_points: int = 15,
+                       sea_points: int = 15,
+                       tile_type: TileType = TileType.HEXAGON,
+                       base_seed: int = 0,
+                       max_turns: int = 100,
+                       fast: bool = True):
+        self.num_envs = num_envs
+        self.size = size
+        self.num_players = num_players
+        self.land_points = land_points
+        self.sea_points = sea_points
+        self.tile_type = tile_type
+        self.base_seed = base_seed
+        self.max_turns = max_turns
+        self.fast = fast
+
+        self.generator = MapGenerator(size=size, land_points=land_points, sea_points=sea_points, tile_type=tile_type)
+        self.encoder = ObservationEncoder(size, num_players)
+        num_cells = size[0] * size[1]
+        self.active = np.zeros((num_envs, num_cells), dtype=bool)
+        self.team = np.full((num_envs, num_cells), -1, dtype=np.int8)
+        self.region_id = np.full((num_envs, num_cells), Board.NO_REGION, dtype=np.int64)
+        self.piece = np.zeros((num_envs, num_cells), dtype=np.uint8)
+        self.observations = self.encoder.allocate(num_envs)
+        self.games: List[Game] = [None] * num_envs
+        self.num_resets = 0
+        self.random_state = np.random.RandomState(base_seed).get_state()
+
+    def swap_random_state(self) -> None:
+        # Exchange the environment's np.random state with the caller's
+        state = np.random.get_state()
+        np.random.set_state(self.random_state)
+        self.random_state = state
+
+    def reset(self) -> np.ndarray:
+        self.swap_random_state()
+        try:
+            self.num_resets = 0
+            self.reset_games(np.arange(self.num_envs))
+        finally:
+            self.swap_random_state()
+        return self.observe()
+
+    def make_game(self, env: int, active: np.ndarray) -> Game:
+        # A new game in slot env on the given land mask, seeded by its reset number
+        map = Map(land_points=self.land_points, sea_points=self.sea_points, size=self.size, tile_type=self.tile_type)
+        map.generator = self.generator
+        map.board.active[:] = active
+        map.board.bind(self.active[env], self.team[env], self.region_id[env], self.piece[env])
+        np.random.seed([self.num_resets, self.base_seed])
+        self.num_resets += 1
+        return Game(map, num_players=self.num_players)
+
+    def reset_games(self, envs: Sequence[int]) -> None:
+        first = self.num_resets
+        if self.fast:
+            masks = self.generator.generate_batch([map_rng(self.base_seed, first + k) for k in range(len(envs))])
+        for k, env in enumerate(envs):
+            if self.fast:
+                active = masks[k]
+            else:
+                active = self.generator.generate(map_rng(self.base_seed, first + k))
+            self.games[env] = self.make_game(env, active)
+
+    def land_counts(self) -> np.ndarray:
+        # (N, teams) number of cells owned by each team
+        if self.fast:
+            offsets = (self.team.astype(np.int64) + 1) + (self.num_players + 1) * np.arange(self.num_envs)[:, None]
+            counts = np.bincount(offsets.ravel(), minlength=self.num_envs * (self.num_players + 1))
+            return counts.reshape(self.num_envs, self.num_players + 1)[:, 1:]
+        counts = np.zeros((self.num_envs, self.num_players), dtype=np.int64)
+        for env, game in enumerate(self.games):
+            for region in game.regions.values():
+                counts[env, region.get_team()] += region.get_size()
+        return counts
+
+    def observe(self) -> np.ndarray:
+        if self.fast:
+            return self.encoder.encode_arrays(self.games, self.active, self.team, self.piece, self.observations)
+        for env, game in enumerate(self.games):
+            self.encoder.encode(game, self.observations[env])
+        return self.observations
+
+    def legal_actions(self) -> List[List[Action]]:
+        return [game.legal_actions() for game in self.games]
+
+    def current_teams(self) -> np.ndarray:
+        return np.array([game.current_team for game in self.games])
+
+    def step(self, actions: Sequence[Action]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Returns observations, rewards and done flags. Done games are already replaced, so their
+        # observations belong to the new game.
+        self.swap_random_state()
+        try:
+            return self.step_games(actions)
+        finally:
+            self.swap_random_state()
+
+    def step_games(self, actions: Sequence[Action]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        acting = self.current_teams()
+        before = self.land_counts()
+        for game, action in zip(self.games, actions):
+            if not game.apply(action):
+                game.apply(END_TURN)
+        after = self.land_counts()
+
+        land = self.active.sum(axis=1)
+        over = [game.is_over() for game in self.games]
+        winners = [game.get_winner() if game_over else None for game, game_over in zip(self.games, over)]
+        turns = np.array([game.turn for game in self.games])
+        if self.fast:
+            envs = np.arange(self.num_envs)
+            won = np.array([-1 if winner is None else winner for winner in winners]) == acting
+            rewards = (after[envs, acting] - before[envs, acting]) / land + won
+            dones = np.array(over) | (turns >= self.max_turns)
+        else:
+            rewards = np.zeros(self.num_envs)
+            dones = np.zeros(self.num_envs, dtype=bool)
+            for env in range(self.num_envs):
+                team = acting[env]
+                rewards[env] = (after[env, team] - before[env, team]) / land[env] + (winners[env] == team)
+                dones[env] = over[env] or turns[env] >= self.max_turns
+        rewards = rewards.astype(np.float32)
+
+        if np.any(dones):
+            self.reset_games(np.flatnonzero(dones))
+        return self.observe(), rewards, dones
@@ -1,7 +1,13 @@
 from map import Map
+import archive
 from region import Region
-from piece import Piece
-from typing import List, Tuple, Dict
+from connectivity import Connectivity
+from piece import Piece, PalmTree, Soldier1, PIECE_TYPES, piece_from_kind, soldier_from_level
+from action import Action, ActionType
+from moves import MoveGenerator
+from zobrist import ZobristKeys
+from observation import ObservationEncoder
+from typing import List, Optional, Tuple, Dict, Set
 import numpy as np
 
 def generate_id(previous_ids):
@@ -17,71 +23,183 @@ class Game:
     '''
 
     # TODO: Implement this class
-    def __init__(self, map: Map, num_players: int = 1):
+    def __init__(self, map: Map, num_players: int = 1, debug: bool = False, initialize: bool = True):
         self.map = map
         self.num_players = num_players
-        self.initialize_map()
+        self.debug = debug # Check the tile to region index after every change
+        self.regions: Dict[int, Region] = {}
+        self.connectivity = {team: Connectivity(map.board, team) for team in range(num_players)}
+        self.current_team = 0
+        self.turn = 0
+        self.moved: Set[Tuple[int, int]] = set() # Soldiers which can not move again this turn
+        self.history: List[Tuple[Action, tuple]] = [] # Actions made with make, and the random state before each if redoable
+        self.undone: List[Tuple[Action, tuple]] = [] # Actions taken back with unmake, for redo
+        if initialize:
+            self.initialize_map()
+            if self.debug:
+                self.check_region_index()
+        self.map.board.track_defense(num_players)
+        self.map.board.track_hash(ZobristKeys(len(self.map), num_players))
+        self.moves = MoveGenerator(self)
+        self.encoder = None
+        if initialize:
+            # The first team collects income and pays upkeep like every later one
+            self.start_turn()
+
+    @classmethod
+    def load(cls, map: Map, index: int = 0, path: str = None, debug: bool = False) -> 'Game':
+        # Restore a game saved with Map.save_map(game=...) from the map archive
+        return cls.from_record(map, map.load_map(index, path), debug=debug)
+
+    @classmethod
+    def from_record(cls, map: Map, record: np.ndarray, debug: bool = False) -> 'Game':
+        # Restore a game from an archive record (see archive.encode_board) on a map of the same size
+        archive.decode_board(record, map.board)
+        game = cls(map, num_players=int(record["num_players"]), debug=debug, initialize=False)
+        game.restore_regions(np.asarray(record["balance"]))
+        game.current_team = int(record["current_team"])
+        game.turn = int(record["turn"])
+        game.moved = set(map.board.coord(index) for index in np.flatnonzero(np.asarray(record["moved"]).ravel()))
+        if game.debug:
+            game.check_region_index()
+        return game
+
+    def to_record(self) -> np.ndarray:
+        # The full state of the game as one archive record, small enough to send to other processes
+        return archive.encode_board(self.map.board, self.regions, self.num_players, self.current_team, self.turn, self.moved)
+
+    def restore_regions(self, balances: np.ndarray) -> None:
+        # Rebuild the regions from the region ids and pieces already on the board, with the balance
+        # of every region given by its id
+        board = self.map.board
+        pieces = board.piece.copy()
+        self.regions = {}
+        in_region = np.flatnonzero(board.region_id != board.NO_REGION)
+        order = in_region[np.argsort(board.region_id[in_region], kind="stable")]
+        _, starts = np.unique(board.region_id[order], return_index=True)
+        for indices in np.split(order, starts[1:]):
+            region_id = int(board.region_id[indices[0]])
+            region = Region(map=self.map, tile_coords=[board.coord(index) for index in indices],
+                            initialize=False, id=region_id, team=int(board.team[indices[0]]))
+            region.set_balance(int(balances[region_id]))
+            for index in indices[pieces[indices] != 0]:
+                region.set_piece(board.coord(index), piece_from_kind(pieces[index]))
+            self.regions[region_id] = region
 
     def initialize_map(self):
         # Assign tiles to players randomly
+        board = self.map.board
         tile_assignments = np.random.randint(self.num_players, size=len(self.map))
-        for tile, assignment in zip(self.map, tile_assignments):
-            tile.set_team(assignment)
+        board.team[:] = np.where(board.active, tile_assignments, -1)
 
-        # Construct regions from map
-        self.regions: Dict[int, Region] = {}
-        for tile in self.map:
-            if tile.is_active():
-                covered = any(map(lambda r: r.contains_tile(tile.get_tile_coords()), self.regions.values()))
-                if not covered:
-                    continuous_tiles = self.map.bfs_find_same_team(tile.get_tile_coords())
-                    uuid = generate_id(self.regions.keys())
-                    self.regions[uuid] = Region(map=self.map, tile_coords=continuous_tiles, id=uuid, team=tile.get_team())
-                    for tile_coord in continuous_tiles:
-                        self.map.get_tile(tile_coord).set_region_id(uuid)
+        # Construct regions from the connected components of each team, labelled in one pass
+        self.regions = {}
+        components = self.map.components
+        components.label_all()
+        for indices in components.groups():
+            uuid = generate_id(self.regions.keys())
+            continuous_tiles = [board.coord(index) for index in indices]
+            self.regions[uuid] = Region(map=self.map, tile_coords=continuous_tiles, id=uuid, team=int(board.team[indices[0]]))
 
     def get_map(self) -> Map:
         return self.map
 
+    def observe(self, out: np.ndarray = None) -> np.ndarray:
+        # (C, H, W) observation of the game from the view of the team to move, see observation.py.
+        # Without out, the same preallocated buffer is filled and returned on every call.
+        if self.encoder is None:
+            self.encoder = ObservationEncoder(self.map.get_size(), self.num_players)
+        return self.encoder.encode(self, out)
+
+    def hash(self) -> int:
+        # 64 bit Zobrist hash of the teams and pieces of all cells and the team to move
+        return self.map.board.hash ^ int(self.map.board.zobrist.side[self.current_team])
+
+    def add_region(self, region: Region) -> None:
+        self.map.board.journal.record(self.regions.pop, region.get_id())
+        self.regions[region.get_id()] = region
+
+    def remove_region(self, region_id: int) -> None:
+        region = self.regions.pop(region_id)
+        self.map.board.journal.record(self.regions.__setitem__, region_id, region)
+
+    def set_turn_state(self, current_team: int, turn: int, moved: Set[Tuple[int, int]]) -> None:
+        self.current_team = current_team
+        self.turn = turn
+        self.moved = moved
+
+    def make(self, action: Action, redoable: bool = True) -> bool:
+        # Apply an action so that it can be taken back with unmake. Returns whether it was valid.
+        # Saving the random state for redo is a large part of the cost, search can skip it. Such
+        # actions are expected to be taken back again, so they leave the redo stack alone.
+        journal = self.map.board.journal
+        random_state = np.random.get_state() if redoable else None
+        journal.mark()
+        journal.record(self.set_turn_state, self.current_team, self.turn, set(self.moved))
+        if not self.apply(action):
+            journal.undo()
+            return False
+        self.history.append((action, random_state))
+        if redoable:
+            self.undone = []
+        return True
+
+    def unmake(self) -> Optional[Action]:
+        # Take back the last action made with make, restoring the exact state from before it.
+        # Costs time proportional to the changes the action made. Returns None if there is no
+        # action to take back.
+        if not self.history:
+            return None
+        self.map.board.journal.undo()
+        action, random_state = self.history.pop()
+        if random_state is not None:
+            self.undone.append((action, random_state))
+        if self.debug:
+            self.check_region_index()
+        return action
+
+    def redo(self) -> bool:
+        # Make the last action taken back with unmake again. The random state from before the
+        # action is restored first, so new huts end up where they were.
+        if not self.undone:
+            return False
+        action, random_state = self.undone.pop()
+        undone = self.undone
+        np.random.set_state(random_state)
+        self.make(action)
+        self.undone = undone
+        return True
+
     def get_region(self, tile_coord: Tuple[int, int]) -> Region:
-        for region in self.regions.values():
-            if region.contains_tile(tile_coord):
-                return region
+        # The board's region id array is the authoritative tile to region index
+        return self.regions.get(self.get_map().get_tile(tile_coord).get_region_id())
 
     def get_region_by_id(self, id: int) -> Region:
         return self.regions.get(id)
 
-    #def set_agent(self, team: int, agent: Agent) -> None:
-    #    self.agents[team] = agent
-
-    # TODO: Finish this function
     def check_valid_move(self, piece: Piece, original_region: Region, target_coord: Tuple[int, int]) -> bool:
         other_region = self.get_region(target_coord)
+        if other_region is None:
+            return False # Target is not on land
         if original_region == other_region:
-            if not other_region.contains_piece(target_coord):
+            other_piece = other_region.get_piece(target_coord)
+            if other_piece is None:
                 return True
+            elif other_piece.name == "palmtree":
+                return piece.moveable # Soldiers can clear trees
             else:
-                other_piece = other_region.get_piece(target_coord)
-                if piece.upgradable and other_piece.upgradeable and piece.power + other_piece.power <= Piece.MAX_SOLDIER_LEVEL:
-                    return True # Can upgrade the piece
-                else:
-                    return False
+                # Can upgrade the piece by combining soldiers
+                return piece.upgradeable and other_piece.upgradeable and piece.power + other_piece.power <= Piece.MAX_SOLDIER_LEVEL
         else:
-            #TODO: Need to check if target coord is neighbor of current region
-
-            # Quick check: See if the other tile contains a more powerful piece
-            other_piece = other_region.get_piece(target_coord)
-            if other_piece and other_piece.power >= piece.power:
+            # Only soldiers can take tiles, and only tiles bordering their region
+            if not piece.moveable:
+                return False
+            if not any(map(original_region.contains_tile, self.get_map().get_neighbors_coords(target_coord))):
                 return False
 
-            # Now need to check to see if there is a surrounding piece which is more powerful
-            target_tile = self.get_map().get_tile(target_coord)
-            other_pieces = map(other_region.get_piece, target_tile.get_neighbors_coords())
-            for other_piece in other_pieces:
-                if other_piece and other_piece.power >= piece.power:
-                    return False
-            
-            return True
+            # The target is protected by its own piece and the pieces of its team around it
+            board = self.get_map().board
+            return board.protection(board.index(target_coord)) < piece.power
 
     # Already assumes that piece placement is valid
     # Need to check if we connected any regions
@@ -104,17 +222,15 @@ class Game:
         if other_piece and other_piece.name == "hut":
             other_region.set_balance(0)
         if other_region.get_size() == 0:
-            del self.regions[other_region.get_id()]
+            self.remove_region(other_region.get_id())
         
         # Add piece to original region
-        target_tile.set_region_id(original_region.id)
-        self.get_map().set_tile(target_coord, target_tile)
         original_region.add_tile(target_coord)
         original_region.set_piece(target_coord, piece)
 
-        check_regions_for_huts = {other_region.id: other_region}
+        check_regions_for_huts = {other_region.id: other_region, original_region.id: original_region}
 
-        neighbor_tiles = list(map(self.get_map().get_tile, list(filter(self.get_map().is_valid_tile_coords, target_tile.get_neighbors_coords()))))
+        neighbor_tiles = list(map(self.get_map().get_tile, self.get_map().get_neighbors_coords(target_coord)))
         home_tiles = list(filter(lambda tile: tile.get_team() == home_team, neighbor_tiles))
         away_tiles = list(filter(lambda tile: tile.get_team() == prev_team, neighbor_tiles))
         
@@ -133,45 +249,190 @@ class Game:
                         first_region = temp
                     first_region.eat_region(second_region)
                     second_id = second_region.get_id()
-                    del self.regions[second_id]
+                    self.remove_region(second_id)
+                    check_regions_for_huts.pop(second_id, None)
+                    check_regions_for_huts[first_region.id] = first_region
                     current_region_id = first_region.get_id()
                     
 
-        # Second go through other team tiles and check if we separated a region
-        for first_idx in range(len(away_tiles)):
-            for second_idx in range(first_idx+1, len(away_tiles)):
-                first, second = away_tiles[first_idx], away_tiles[second_idx]
-                if first.get_region_id() == second.get_region_id():
-                    first_coords, second_coords = first.get_tile_coords(), second.get_tile_coords()
-                    # Need to check if there is still a path between first and second
-                    if not second_coords in self.get_map().bfs_same_team_generator(first_coords):
-                        #TODO: Write a function so split a region in two, and do that right here
-                        first_tiles = list(self.get_map().bfs_same_team_generator(first_coords))
-                        second_tiles = list(self.get_map().bfs_same_team_generator(second_coords))
-                        region = self.regions[first.get_region_id()]
-
-                        hut_coord = region.get_hut_coord()
-                        if hut_coord in first_tiles:
-                            stay_tiles, remove_tiles = first_tiles, second_tiles
-                        else:
-                            stay_tiles, remove_tiles = second_tiles, first_tiles
-                        
-                        uuid = generate_id(self.regions.keys())
-                        new_region = Region(self.get_map(), remove_tiles, initialize=False, id=uuid, team=region.get_team())
-                        self.regions[uuid] = new_region
-                        for tile_coord in remove_tiles:
-                            self.get_map().get_tile(tile_coord).set_region_id(uuid)
-                            region.remove_tile(tile_coord)
-                        for piece_coord in region.pieces.keys():
-                            if piece_coord in remove_tiles:
-                                new_region.set_piece(piece_coord, region.pieces[piece_coord])
-                                del region.pieces[piece_coord]
-                        check_regions_for_huts[region.id] = region
-                        check_regions_for_huts[new_region.id] = new_region
-                        
+        # Second check if we separated the other team's region. All of its neighboring tiles were
+        # connected through the target tile, so search from all of them at once until they meet
+        # again or all but one side are exhausted, and split off the exhausted sides.
+        if len(away_tiles) > 1:
+            board = self.get_map().board
+            seeds = board.indices([tile.get_tile_coords() for tile in away_tiles])
+            pieces, rest = self.connectivity[prev_team].split(seeds)
+            if rest is None and len(pieces) > 0:
+                # Every side was explored, so keep the side with the hut (or the largest side)
+                hut_index = board.index(other_region.get_hut_coord()) if other_region.contains_hut() else None
+                stay = max(pieces, key=lambda piece: (hut_index in piece, len(piece)))
+                pieces = [piece for piece in pieces if piece is not stay]
+            for region in self.split_region(other_region, pieces):
+                check_regions_for_huts[region.id] = region
+
         for region_id in check_regions_for_huts.keys():
             region = check_regions_for_huts[region_id]
             region.add_hut()
 
+        if self.debug:
+            self.check_region_index()
+
+        return current_region_id
+
+    def put_piece(self, piece: Piece, region: Region, target_coord: Tuple[int, int], moved: bool = False) -> int:
+        # Put a piece moved or bought by region on a target which already passed check_valid_move.
+        # Returns the id of the region the piece ends up in.
+        if region.contains_tile(target_coord):
+            other_piece = region.get_piece(target_coord)
+            if other_piece is not None and other_piece.upgradeable:
+                moved = moved or target_coord in self.moved
+                piece = soldier_from_level(piece.power + other_piece.power)
+            elif other_piece is not None:
+                moved = True # Clearing a tree takes the whole move
+            region.set_piece(target_coord, piece)
+            region_id = region.get_id()
+        else:
+            moved = True
+            region_id = self.place_piece(piece, region, target_coord)
+        if piece.moveable and moved:
+            self.moved.add(target_coord)
+        else:
+            self.moved.discard(target_coord)
+        return region_id
+
+    def move(self, source_coord: Tuple[int, int], target_coord: Tuple[int, int]) -> bool:
+        region = self.get_region(source_coord)
+        if region is None or region.get_team() != self.current_team or source_coord == target_coord:
+            return False
+        piece = region.get_piece(source_coord)
+        if piece is None or not piece.moveable or source_coord in self.moved:
+            return False
+        if not self.check_valid_move(piece, region, target_coord):
+            return False
+        region.remove_piece(source_coord)
+        self.put_piece(piece, region, target_coord)
+        return True
+
+    def buy(self, source_coord: Tuple[int, int], piece_kind: int, target_coord: Tuple[int, int]) -> bool:
+        region = self.get_region(source_coord)
+        if region is None or region.get_team() != self.current_team or not region.contains_hut():
+            return False
+        piece_type = PIECE_TYPES.get(piece_kind)
+        if piece_type is None or not piece_type.purchasable or region.get_balance() < piece_type.initial_cost:
+            return False
+        piece = piece_type()
+        if not self.check_valid_move(piece, region, target_coord):
+            return False
+        region.set_balance(region.get_balance() - piece.initial_cost)
+        self.put_piece(piece, region, target_coord)
+        return True
+
+    def upgrade(self, source_coord: Tuple[int, int]) -> bool:
+        # Train the soldier on source_coord up one level, at the cost of a new level 1 soldier
+        region = self.get_region(source_coord)
+        if region is None or region.get_team() != self.current_team or not region.contains_hut():
+            return False
+        piece = region.get_piece(source_coord)
+        if piece is None or not piece.upgradeable or piece.power >= Piece.MAX_SOLDIER_LEVEL:
+            return False
+        if region.get_balance() < Soldier1.initial_cost:
+            return False
+        region.set_balance(region.get_balance() - Soldier1.initial_cost)
+        region.set_piece(source_coord, soldier_from_level(piece.power + 1))
+        return True
+
+    def apply(self, action: Action) -> bool:
+        # Apply an action for the current team, returns whether it was valid
+        if action.type == ActionType.MOVE:
+            return self.move(action.source, action.target)
+        elif action.type == ActionType.BUY:
+            return self.buy(action.source, action.piece_kind, action.target)
+        elif action.type == ActionType.UPGRADE:
+            return self.upgrade(action.source)
+        elif action.type == ActionType.END_TURN:
+            self.end_turn()
+            return True
+        return False
+
+    def legal_actions(self, team: int = None) -> List[Action]:
+        return self.moves.legal_actions(team)
+
+    def get_team_regions(self, team: int) -> List[Region]:
+        return [region for region in self.regions.values() if region.get_team() == team]
+
+    def get_alive_teams(self) -> List[int]:
+        # A team is still in the game while it holds a region big enough for a hut
+        return sorted(set(region.get_team() for region in self.regions.values() if region.get_size() > 1))
+
+    def is_over(self) -> bool:
+        return len(self.get_alive_teams()) <= 1
+
+    def get_winner(self) -> int:
+        alive = self.get_alive_teams()
+        return alive[0] if len(alive) == 1 else None
+
+    def end_turn(self) -> None:
+        # Pass the turn to the next team still in the game and collect its income
+        self.moved.clear()
+        alive = self.get_alive_teams()
+        if len(alive) == 0:
+            return
+        later = [team for team in alive if team > self.current_team]
+        if later:
+            self.current_team = later[0]
+        else:
+            self.current_team = alive[0]
+            self.turn += 1
+        self.start_turn()
+
+    def start_turn(self) -> None:
+        # Every region of the current team earns one per tile if it has a hut and pays the upkeep
+        # of its pieces. Soldiers of a region which can not pay die and leave trees behind.
+        for region in self.get_team_regions(self.current_team):
+            income = region.get_size() if region.contains_hut() else 0
+            upkeep = sum(piece.turn_cost for piece in region.pieces.values())
+            balance = region.get_balance() + income - upkeep
+            if balance < 0:
+                for tile_coord, piece in list(region.pieces.items()):
+                    if piece.moveable:
+                        region.set_piece(tile_coord, PalmTree())
+                balance = 0
+            region.set_balance(balance)
+
+    def split_region(self, region: Region, groups: List[np.ndarray]) -> List[Region]:
+        # Move each group of flat indices out of the region into a new region. Only the moved
+        # tiles are touched. If the hut moves with a group, that group also takes the balance.
+        board = self.get_map().board
+        new_regions = []
+        for group in groups:
+            remove_tiles = [board.coord(index) for index in group]
+            uuid = generate_id(self.regions.keys())
+            new_region = Region(self.get_map(), remove_tiles, initialize=False, id=uuid, team=region.get_team())
+            new_region.set_balance(0)
+            self.add_region(new_region)
+            for tile_coord in remove_tiles:
+                region.remove_tile(tile_coord)
+                if region.contains_piece(tile_coord):
+                    piece = region.get_piece(tile_coord)
+                    region.remove_piece(tile_coord)
+                    new_region.set_piece(tile_coord, piece)
+                    if piece.name == "hut":
+                        new_region.set_balance(region.get_balance())
+                        region.set_balance(0)
+            new_regions.append(new_region)
+        return [region] + new_regions if new_regions else []
 
-        return current_region_id
\ No newline at end of file
+    def check_region_index(self) -> None:
+        # Debug check that the tile to region index agrees with the tiles held by each region
+        board = self.get_map().board
+        num_indexed = 0
+        for region_id, region in self.regions.items():
+            indices = board.indices(region.tile_coords)
+            mismatched = indices[board.region_id[indices] != region_id]
+            if len(mismatched) > 0:
+                raise Exception(f"Region {region_id} holds tiles {[board.coord(index) for index in mismatched]} which are indexed to other regions!")
+            num_indexed += len(indices)
+        if np.count_nonzero(board.region_id != board.NO_REGION) != num_indexed:
+            raise Exception("Region index contains tiles which do not belong to any region!")
+        if np.any(board.active != (board.region_id != board.NO_REGION)):
+            raise Exception("Region index does not cover exactly the active tiles!")
@@ -33,16 +33,25 @@ class Grid(ABC):
     def grid(self):
         pass
 
-    def get(self, coord: Tuple[int, int]) -> Tuple[int, int]:
+    def get(self, coord: Tuple[int, int]) -> np.ndarray:
         if coord[0] < 0 or coord[0] >= self.rows or coord[1] < 0 or coord[1] >= self.cols:
             raise ValueError(f"Tried to access invalid coordinates: {coord}")
         else:
-            return self.grid[coord[0]][coord[1]]
+            return self.grid[coord[0], coord[1]]
+
+    def get_many(self, coords: np.ndarray) -> np.ndarray:
+        # Points of an (..., 2) array of grid coordinates, as an (..., 2) array
+        coords = np.asarray(coords)
+        rows, cols = coords[..., 0], coords[..., 1]
+        if np.any((rows < 0) | (rows >= self.rows) | (cols < 0) | (cols >= self.cols)):
+            raise ValueError("Tried to access invalid coordinates!")
+        return self.grid[rows, cols]
 
 class HexGrid(Grid):
     '''
     A hexagonal grid. Points are aligned along rows and shifted in alternating rows,
-    forming equilateral triangles between neighboring points.
+    forming equilateral triangles between neighboring points. The points are kept in a
+    (rows, cols, 2) array of screen coordinates.
     '''
 
     grid = None
@@ -54,20 +63,16 @@ class HexGrid(Grid):
         super().__init__(rows=rows, cols=cols, top_left=top_left, scale=scale)
 
         self.grid = self.make_hex_grid(top_left=self.top_left, side_length=self.scale)
-    
-    def make_horizontal_line(self, left_pos=(0, 0), side_length=1):
-        return [(left_pos[0] + x*side_length, left_pos[1]) for x in range(self.cols)]
 
-    def make_hex_grid(self,top_left=(0, 0), side_length=1):
-        def dx(i):
-            if i % 2 == 0:
-                return 0
-            else:
-                return cos(5*pi/3)*side_length
-        def dy(i):
-            return i*sin(5*pi/3)*side_length
-        return [self.make_horizontal_line((top_left[0]+dx(i), top_left[1]-dy(i)), side_length)
-            for i in range(self.rows)]
+    def make_hex_grid(self, top_left=(0, 0), side_length=1) -> np.ndarray:
+        # Odd rows are shifted right by half a side, and rows are sin(pi/3) sides apart
+        row = np.arange(self.rows)
+        dx = np.where(row % 2 == 0, 0, cos(5*pi/3)*side_length)
+        dy = row*sin(5*pi/3)*side_length
+        grid = np.empty((self.rows, self.cols, 2))
+        grid[..., 0] = (top_left[0] + dx)[:, None] + np.arange(self.cols)*side_length
+        grid[..., 1] = (top_left[1] - dy)[:, None]
+        return grid
 
     @classmethod
     def scale_from_size(cls, top_left: Tuple[float, float], 
@@ -0,0 +1,45 @@
+from typing import Callable, List, Tuple
+
+class Journal:
+    '''
+    Make/unmake log of changes to a game, for search agents which try a move and take it back.
+    While a mark is open, every change to the board, the regions and the game records the call
+    which reverts it. Undoing replays those calls in reverse order back to the last mark, so
+    rolling back costs time proportional to the number of changes, not the size of the game.
+    Nothing is recorded while there is no open mark or while the journal is replaying.
+    '''
+
+    def __init__(self):
+        self.entries: List[Tuple[Callable, tuple]] = []
+        self.marks: List[int] = []
+        self.replaying = False
+
+    def __len__(self):
+        return len(self.entries)
+
+    def record(self, undo: Callable, *args) -> None:
+        if self.marks and not self.replaying:
+            self.entries.append((undo, args))
+
+    def depth(self) -> int:
+        return len(self.marks)
+
+    def mark(self) -> None:
+        self.marks.append(len(self.entries))
+
+    def commit(self) -> None:
+        # Close the last mark, its changes become part of the mark before it (or are dropped if none)
+        self.marks.pop()
+        if not self.marks:
+            self.entries.clear()
+
+    def undo(self) -> None:
+        # Revert every change made since the last mark
+        start = self.marks.pop()
+        self.replaying = True
+        try:
+            while len(self.entries) > start:
+                undo, args = self.entries.pop()
+                undo(*args)
+        finally:
+            self.replaying = False
@@ -1,7 +1,11 @@
 from typing import Tuple, List, Generator
 from tile import Tile, TileType
+from board import Board
+from components import Components
+from mapgen import MapGenerator, map_rng, generate_map_batch
+import archive
 import numpy as np
-from queue import PriorityQueue, Queue
+from collections import deque
 
 class Map:
     '''
@@ -19,94 +23,78 @@ class Map:
         self.num_sea_points = sea_points
         self.size = size # size in (rows, cols)
         self.tile_type = tile_type
-
-    def make_map(self) -> None:
-
-        # Generate list of all possible points (indexed by (row, col)) in the grid
-        rows, cols = np.meshgrid(np.arange(self.size[0]), np.arange(self.size[1]))
-        rows = rows.flatten()
-        cols = cols.flatten()
-        points = np.array([(rows[i], cols[i]) for i in range(self.size[0] * self.size[1])])
-
-        # Select unique points for land and sea points
-        
-        sample = np.random.choice(np.arange(len(points)), size=self.num_land_points + self.num_sea_points, replace=False)
-        selected_points = list(map(tuple, list(points[sample])))
-
-        land_points = selected_points[:self.num_land_points]
-        sea_points = selected_points[self.num_land_points:]
-
-        # Make mapping of points
-        tile_constructor = Tile.get_tile_constructor(self.tile_type)
-        self.map_tiles = [[tile_constructor((i, j)) for j in np.arange(self.size[1])] for i in np.arange(self.size[0])]
-
-        # Make land points active tiles, sea points inactive
-        for point in land_points:
-            i, j = point
-            self.map_tiles[i][j].set_activity(True)
-        for point in sea_points:
-            i, j = point
-            self.map_tiles[i][j].set_activity(False)
-
-        # Set up priority queue for breadth-first expansion of land and sea points
-        reached = [[False for j in np.arange(self.size[1])] for i in np.arange(self.size[0])]
-        q = PriorityQueue()
-        counter = 0
-        np.random.shuffle(selected_points)
-        for point in selected_points:
-            i,j = point
-            q.put((0, counter, self.map_tiles[i][j]))
-            counter += 1
-            reached[i][j] = True
-            
-        # Now expand each tile and set them to the activity of their parent
-        while not q.empty():
-            priority, order, tile = q.get()
-            neighbor_coords = tile.get_neighbors_coords()
-            neighbor_coords = list(np.random.permutation(neighbor_coords))
-            for coord in neighbor_coords:
-                i, j = coord
-                if self.in_range(coord) and not reached[i][j]:
-                    reached[i][j] = True
-                    self.map_tiles[i][j].set_activity(tile.is_active())
-                    q.put((priority+1, counter, self.map_tiles[i][j]))
-                    counter += 1
-
-        # Check for connectivity of resulting map, start over if necessary
-
-        # First, start at a land point and bfs to find all reachable points
-        reached = [[False for j in np.arange(self.size[1])] for i in np.arange(self.size[0])]
-        q = Queue()
-        q.put(land_points[0])
-        while not q.empty():
-            point = q.get()
-            tile = self.get_tile(point)
-            for coord in tile.get_neighbors_coords():
-                i, j = coord
-                if self.in_range(coord) and not reached[i][j]:
-                    neighbor = self.get_tile(coord)
-                    if neighbor.is_active():
-                        q.put(coord)
-                        reached[i][j] = True
-
-        # Start over if we find an active point which isn't reached
-        for i in range(self.size[0]):
-            for j in range(self.size[1]):
-                tile = self.get_tile((i, j))
-                if tile.is_active() and not reached[i][j]:
-                    self.make_map()
-                    return
+        self.board = Board(size=size, tile_type=tile_type)
+        self.components = Components(self.board)
+        self.generator = None
+
+    def make_map(self, rng: np.random.Generator = None) -> None:
+        self.board = Board(size=self.size, tile_type=self.tile_type)
+        self.components = Components(self.board)
+        self.board.active[:] = self.get_generator().generate(rng)
+
+    def make_map_from_seed(self, base_seed: int, index: int = 0) -> None:
+        # Reproduces map number index of a batch generated with make_map_batch
+        self.make_map(map_rng(base_seed, index))
+
+    @classmethod
+    def make_map_batch(cls, out_dir: str, base_seed: int, count: int,
+                            size: Tuple[int, int] = (1, 1),
+                            land_points: int = 1,
+                            sea_points: int = 0,
+                            tile_type: TileType = TileType.HEXAGON,
+                            shard_size: int = 4096,
+                            workers: int = None) -> List[str]:
+        # Generate count maps in a process pool and write them to .npz shards in out_dir
+        return generate_map_batch(out_dir, base_seed, count, size, land_points, sea_points,
+                                  tile_type=tile_type, shard_size=shard_size, workers=workers)
+
+    def get_generator(self) -> MapGenerator:
+        # The generator precomputes the board adjacency, so it is built once and reused
+        if self.generator is None:
+            self.generator = MapGenerator(size=self.size, land_points=self.num_land_points,
+                                          sea_points=self.num_sea_points, tile_type=self.tile_type)
+        return self.generator
 
     def get_tile(self, coord : Tuple[int, int]) -> Tile:
-        row, col = coord
-        return self.map_tiles[row][col]
+        return self.board.get_tile(coord)
 
     def set_tile(self, coord : Tuple[int, int], tile: Tile) -> None:
-        row, col = coord
-        self.map_tiles[row][col] = tile
+        # Tiles are views onto the board, so setting a tile copies its state into the cell
+        target = self.get_tile(coord)
+        target.set_activity(tile.is_active())
+        target.set_team(tile.get_team())
+        target.set_region_id(tile.get_region_id())
 
     def is_valid_tile_coords(self, tile_coords: Tuple[int, int]) -> bool:
-        return tile_coords[0] >= 0 and tile_coords[0] >= 0 and tile_coords[1] < self.size[0] and tile_coords[1] < self.size[1]
+        return self.in_range(tile_coords)
+
+    @property
+    def neighbors(self) -> np.ndarray:
+        # (N, 6) table of flat neighbor indices, -1 marks a neighbor which is off the board
+        return self.board.neighbors
+
+    def get_neighbor_indices(self, indices) -> np.ndarray:
+        # Neighbors of K cells at once as a (K, 6) array, -1 for off board slots
+        return self.board.neighbors[np.asarray(indices)]
+
+    def get_neighbors_coords(self, tile_coords: Tuple[int, int]) -> List[Tuple[int, int]]:
+        # On board neighbors of a single tile
+        neighbors = self.board.neighbors[self.board.index(tile_coords)]
+        return [self.board.coord(neighbor) for neighbor in neighbors if neighbor >= 0]
+
+    def same_team_neighbor_mask(self, indices=None) -> np.ndarray:
+        # (K, 6) mask of neighbors which are on the board, active and on the same team as the cell
+        board = self.board
+        if indices is None:
+            indices = np.arange(len(board))
+        indices = np.asarray(indices)
+        neighbors = board.neighbors[indices]
+        on_board = neighbors >= 0
+        same_team = board.team[neighbors] == board.team[indices][..., None]
+        return on_board & same_team & board.active[neighbors]
+
+    def count_same_team_neighbors(self, indices=None) -> np.ndarray:
+        return self.same_team_neighbor_mask(indices).sum(axis=-1)
 
     def get_size(self) -> Tuple[int, int]:
         return self.size
@@ -115,23 +103,12 @@ class Map:
         return self.tile_type
 
     def __iter__(self):
-        self.iter_i = 0
-        self.iter_j = 0
-        return self
-
-    def __next__(self):
-        i, j = self.iter_i, self.iter_j
-        self.iter_i += 1
-        if self.iter_i >= self.size[0]:
-            self.iter_j += 1
-            if self.iter_j >= self.size[1]:
-                raise StopIteration
-            else:
-                self.iter_i = 0
-        return self.get_tile((i, j))
+        # Iterate over every tile of the board in flat index order
+        for index in range(len(self.board)):
+            yield self.get_tile(self.board.coord(index))
 
     def __len__(self):
-        return self.size[0] * self.size[1]
+        return len(self.board)
 
     def bfs_find_same_team(self, start_coord: Tuple[int, int]) -> List[Tuple[int, int]]:
         #if not self.in_range(start_coord):
@@ -166,34 +143,44 @@ class Map:
         if not self.in_range(start_coord):
             return
 
-        # Set up priority queue
-        reached = [[False for j in np.arange(self.size[1])] for i in np.arange(self.size[0])]
-        counter = 0
-
-        q = PriorityQueue()
-        q.put((0, counter, self.get_tile(start_coord)))
-        reached[start_coord[0]][start_coord[1]] = True
-        team = self.get_tile(start_coord).get_team()
+        board = self.board
+        start = board.index(start_coord)
+        team = board.team[start]
+        reached = {start}
+        q = deque([start])
         yield start_coord
             
-        while not q.empty():
-            priority, _, tile = q.get()
-            neighbor_coords = tile.get_neighbors_coords()
-            for coord in neighbor_coords:
-                i, j = coord
-                if self.in_range(coord) and not reached[i][j]:
-                    neighbor = self.get_tile(coord)
-                    if neighbor.get_team() == team and neighbor.is_active():
-                        reached[i][j] = True
-                        q.put((priority+1, counter, self.get_tile(coord)))
-                        counter += 1
-                        yield coord
-
-    def save_map(self):
-        pass
-
-    def load_map(self):
-        pass
+        while q:
+            index = q.popleft()
+            for neighbor in self.components.adjacency[index]:
+                if neighbor >= 0 and neighbor not in reached and board.team[neighbor] == team and board.active[neighbor]:
+                    reached.add(neighbor)
+                    q.append(neighbor)
+                    yield board.coord(neighbor)
+
+    def save_map(self, path: str = None, game=None) -> int:
+        # Append the board, and the full state of the game played on it if given, to the map
+        # archive at path (defaults to the map's path). Returns the index of the saved board.
+        path = path or self.path
+        if game is None:
+            record = archive.encode_board(self.board)
+        else:
+            record = game.to_record()
+        return archive.append_records(path, self.size, self.tile_type, [record])
+
+    def load_map(self, index: int = 0, path: str = None) -> np.ndarray:
+        # Load a board from the map archive at path (defaults to the map's path). The archive is
+        # memory mapped, so only the requested board is read. Returns the board's record.
+        path = path or self.path
+        header = archive.read_header(path)
+        self.size = archive.header_size(header)
+        self.tile_type = archive.header_tile_type(header)
+        self.board = Board(size=self.size, tile_type=self.tile_type)
+        self.components = Components(self.board)
+        self.generator = None
+        record = archive.open_archive(path)[index]
+        archive.decode_board(record, self.board)
+        return record
 
     def in_range(self, tile_coords: Tuple[int, int]) -> bool:
         return tile_coords[0] >= 0 and tile_coords[0] < self.size[0] and \
@@ -0,0 +1,150 @@
+from typing import List, Tuple
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from tile import Tile, TileType
+from components import neighbor_edges, label_edges
+import numpy as np
+
+def map_rng(base_seed: int, index: int) -> np.random.Generator:
+    # Every map of a batch gets its own generator, derived only from (base_seed, index)
+    return np.random.default_rng([index, base_seed])
+
+class MapGenerator:
+    '''
+    Generates the land masks of maps with array operations. Land and sea seed points grow
+    outwards one ring of cells per sweep, with every newly reached cell copying a random
+    neighbor which was already reached. Only the largest connected body of land is kept, so a
+    map never has to be regenerated from scratch. Many maps are grown in lockstep as one batch.
+    '''
+
+    def __init__(self, size: Tuple[int, int] = (1, 1),
+                       land_points: int = 1,
+                       sea_points: int = 0,
+                       tile_type: TileType = TileType.HEXAGON):
+        self.size = size
+        self.num_land_points = land_points
+        self.num_sea_points = sea_points
+        self.tile_type = tile_type
+        self.num_cells = size[0] * size[1]
+        if land_points < 1 or land_points + sea_points > self.num_cells:
+            raise ValueError(f"Cannot place {land_points} land and {sea_points} sea points on a board of size {size}!")
+
+        # Built once per generator and shared by every map it generates
+        self.neighbors = Tile.get_tile_constructor(tile_type).make_neighbor_table(size)
+        self.edges = neighbor_edges(self.neighbors)
+
+    def generate(self, rng: np.random.Generator = None) -> np.ndarray:
+        # Returns a flat boolean mask of the active (land) cells. Without a generator, one is seeded
+        # from the global NumPy random state.
+        if rng is None:
+            rng = np.random.default_rng(np.random.randint(2**32, dtype=np.uint64))
+        return self.generate_batch([rng])[0]
+
+    def generate_many(self, count: int, rng: np.random.Generator = None, batch_size: int = 64) -> np.ndarray:
+        # (count, rows, cols) boolean array of land masks, grown batch_size maps at a time
+        if rng is None:
+            rng = np.random.default_rng(np.random.randint(2**32, dtype=np.uint64))
+        rngs = [np.random.default_rng(seed) for seed in rng.integers(2**63, size=count)]
+        active = np.empty((count, self.num_cells), dtype=bool)
+        for start in range(0, count, batch_size):
+            active[start:start+batch_size] = self.generate_batch(rngs[start:start+batch_size])
+        return active.reshape(count, *self.size)
+
+    def generate_batch(self, rngs: List[np.random.Generator]) -> np.ndarray:
+        # (B, N) boolean array with one flat land mask per generator. Each map only draws from its
+        # own generator, so a map does not depend on the other maps in the batch.
+        num_maps, num_cells = len(rngs), self.num_cells
+        num_seeds = self.num_land_points + self.num_sea_points
+
+        # Maps are laid out one after another in a flat state array (-1 for cells not reached yet),
+        # and the last slot of every map is a sentinel (-2) which off board neighbors read from.
+        # Every cell is reached exactly once, so one random key per neighbor slot decides which
+        # reached neighbor it copies.
+        stride = num_cells + 1
+        state = np.full(num_maps * stride, -1, dtype=np.int8)
+        state[num_cells::stride] = -2
+        keys = np.empty((num_maps, num_cells, self.neighbors.shape[1]), dtype=np.float32)
+        reached = []
+        for idx, rng in enumerate(rngs):
+            seeds = rng.choice(num_cells, size=num_seeds, replace=False)
+            state[idx * stride + seeds[:self.num_land_points]] = 1
+            state[idx * stride + seeds[self.num_land_points:]] = 0
+            keys[idx] = rng.random(keys.shape[1:], dtype=np.float32)
+            reached.append(idx * stride + seeds)
+        reached = np.concatenate(reached)
+        neighbors = np.where(self.neighbors >= 0, self.neighbors, num_cells)
+
+        # Grow one ring per sweep, only looking at the neighbors of the cells reached last sweep.
+        # Cells which no seed can reach stay sea.
+        position = np.empty(len(state), dtype=np.int64)
+        while len(reached) > 0:
+            frontier = (neighbors[reached % stride] + (reached - reached % stride)[:, None]).ravel()
+            frontier = frontier[state[frontier] == -1]
+            # Drop duplicates by keeping the last write of every cell
+            position[frontier] = np.arange(len(frontier))
+            frontier = frontier[position[frontier] == np.arange(len(frontier))]
+            if len(frontier) == 0:
+                break
+            maps, cells = np.divmod(frontier, stride)
+            neighbor_state = state[neighbors[cells] + (frontier - cells)[:, None]]
+            picked = np.where(neighbor_state >= 0, keys[maps, cells], np.float32(-1)).argmax(axis=1)
+            state[frontier] = neighbor_state[np.arange(len(picked)), picked]
+            reached = frontier
+
+        cells = state.reshape(num_maps, stride)[:, :-1]
+        return self.keep_largest_land(cells == 1)
+
+    def keep_largest_land(self, active: np.ndarray) -> np.ndarray:
+        # Label the land of all maps at once as one graph, with each map's cells offset by its
+        # position in the batch, then keep the largest component of each map
+        num_maps, num_cells = active.shape
+        offsets = (np.arange(num_maps) * num_cells)[:, None]
+        sources, targets = self.edges
+        keep = active[:, sources] & active[:, targets]
+        sources = (sources[None, :] + offsets)[keep]
+        targets = (targets[None, :] + offsets)[keep]
+        labels = label_edges(num_maps * num_cells, sources, targets)
+        sizes = np.bincount(labels[active.ravel()], minlength=num_maps * num_cells).reshape(num_maps, num_cells)
+        largest = sizes.argmax(axis=1) + offsets[:, 0]
+        return active & (labels.reshape(num_maps, num_cells) == largest[:, None])
+
+def generate_shard(path: Path, base_seed: int, start: int, stop: int,
+                   size: Tuple[int, int], land_points: int, sea_points: int,
+                   tile_type: TileType = TileType.HEXAGON, batch_size: int = 64) -> Path:
+    # Generate maps [start, stop) of a batch and write them to one compressed .npz shard, with the
+    # land masks bit-packed into one row per map
+    generator = MapGenerator(size=size, land_points=land_points, sea_points=sea_points, tile_type=tile_type)
+    indices = np.arange(start, stop)
+    active = np.empty((len(indices), generator.num_cells), dtype=bool)
+    for offset in range(0, len(indices), batch_size):
+        rngs = [map_rng(base_seed, index) for index in indices[offset:offset+batch_size]]
+        active[offset:offset+batch_size] = generator.generate_batch(rngs)
+    np.savez_compressed(path, index=indices, active=np.packbits(active, axis=1),
+                        size=np.array(size), base_seed=np.array(base_seed),
+                        land_points=np.array(land_points), sea_points=np.array(sea_points),
+                        tile_type=np.array(tile_type.value))
+    return path
+
+def generate_map_batch(out_dir: str, base_seed: int, count: int,
+                       size: Tuple[int, int], land_points: int, sea_points: int,
+                       tile_type: TileType = TileType.HEXAGON,
+                       shard_size: int = 4096, workers: int = None) -> List[Path]:
+    # Generate count maps across a process pool, one shard per task. Map i of the batch only depends
+    # on (base_seed, i), so the output does not depend on the number of workers or the shard size.
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    tasks = [(out_dir.joinpath(f"maps_{base_seed}_{start:09d}.npz"), base_seed, start, min(start + shard_size, count),
+              size, land_points, sea_points, tile_type) for start in range(0, count, shard_size)]
+    if workers == 1:
+        return [generate_shard(*task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(generate_shard, *task) for task in tasks]
+        return [future.result() for future in futures]
+
+def read_map_shard(path: str) -> Tuple[np.ndarray, np.ndarray]:
+    # Returns the batch indices of a shard's maps and their (count, rows, cols) land masks
+    with np.load(path) as shard:
+        size = tuple(shard["size"])
+        active = np.unpackbits(shard["active"], axis=1, count=size[0] * size[1]).astype(bool)
+        return shard["index"], active.reshape(-1, *size)
+
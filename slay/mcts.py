@@ -0,0 +1,246 @@
+'''
+Monte Carlo Tree Search agent. Every node of the tree is a position and every edge a single
+action, so a turn is a chain of actions ending with END_TURN. A search descends the tree with
+UCT, expands one new action, plays a light playout for a few turns and backs up every team's
+share of the land. Positions are visited with Game.make/unmake, never copied.
+
+Playouts use light rules: instead of listing all legal actions, each step proposes a random
+capture or purchase next to a random tile of the team's regions and keeps it if
+check_valid_move accepts it.
+
+Work is spread over a process pool with root parallelisation: every worker searches its own
+tree from the same root position, shipped as an archive record, and the visit counts of the
+root actions are summed. Within a tree, leaves are selected in small batches with a virtual
+loss on their paths, so a batch spreads over different branches.
+'''
+
+from typing import Dict, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from map import Map
+from game import Game
+from agent import Agent
+from piece import Soldier1
+from action import Action, ActionType, END_TURN
+import argparse
+import math
+import time
+import numpy as np
+
+class Node:
+
+    def __init__(self, action: Action = None, parent: 'Node' = None, team: int = None):
+        self.action = action
+        self.parent = parent
+        self.team = team # Team which played the action leading here
+        self.children: List[Node] = []
+        self.untried: List[Action] = None
+        self.visits = 0
+        self.value = 0.0
+
+    def uct_child(self, exploration: float) -> 'Node':
+        log_visits = math.log(max(self.visits, 1))
+        return max(self.children, key=lambda child: child.value / child.visits
+                   + exploration * math.sqrt(log_visits / child.visits))
+
+def land_shares(game: Game) -> np.ndarray:
+    board = game.get_map().board
+    counts = np.bincount(board.team[board.active & (board.team >= 0)], minlength=game.num_players)
+    return counts / max(counts.sum(), 1)
+
+def light_action(game: Game, rng: np.random.Generator, tries: int = 4) -> Optional[Action]:
+    # A random capture by a soldier or a new soldier, or None if no proposal was valid
+    regions = [region for region in game.get_team_regions(game.current_team) if region.get_size() > 1]
+    if not regions:
+        return None
+    map_ = game.get_map()
+    for _ in range(tries):
+        region = regions[rng.integers(len(regions))]
+        tiles = region.tile_coords
+        neighbors = map_.get_neighbors_coords(tiles[rng.integers(len(tiles))])
+        target = neighbors[rng.integers(len(neighbors))] if neighbors else None
+        if target is None or region.contains_tile(target):
+            continue
+        soldiers = [coord for coord, piece in region.pieces.items() if piece.moveable and coord not in game.moved]
+        if soldiers and rng.random() < 0.7:
+            source = soldiers[rng.integers(len(soldiers))]
+            if game.check_valid_move(region.get_piece(source), region, target):
+                return Action(ActionType.MOVE, source=source, target=target)
+        elif region.contains_hut() and region.get_balance() >= Soldier1.initial_cost:
+            if game.check_valid_move(Soldier1(), region, target):
+                return Action(ActionType.BUY, source=region.get_hut_coord(), target=target, piece_kind=Soldier1.kind)
+    return None
+
+def light_playout(game: Game, rng: np.random.Generator, turns: int, max_actions: int = 6) -> int:
+    # Play light random actions for a number of turns, returns how many actions were made
+    made = 0
+    last_turn = game.turn + turns
+    while not game.is_over() and game.turn < last_turn:
+        for _ in range(max_actions):
+            action = light_action(game, rng)
+            if action is None or not game.make(action, redoable=False):
+                break
+            made += 1
+        game.make(END_TURN, redoable=False)
+        made += 1
+    return made
+
+class TreeSearch:
+    '''
+    One search tree over a game, which is changed during the search and restored afterwards.
+    '''
+
+    def __init__(self, game: Game, rng: np.random.Generator, exploration: float = 1.4,
+                 playout_turns: int = 2, virtual_loss: int = 1, batch_size: int = 4):
+        if virtual_loss < 1:
+            # Nodes selected earlier in a batch are not backed up yet, UCT needs them visited
+            raise ValueError(f"Virtual loss must be at least 1, got {virtual_loss}!")
+        self.game = game
+        self.rng = rng
+        self.exploration = exploration
+        self.playout_turns = playout_turns
+        self.virtual_loss = virtual_loss
+        self.batch_size = batch_size
+        self.root = Node()
+        self.rollouts = 0
+
+    def select(self) -> Tuple[Node, int]:
+        # Descend to a leaf and expand it, making the actions on the way. Returns the new node and
+        # the number of actions made.
+        # The virtual loss is added once to every node on the path and taken back by backup.
+        game = self.game
+        node = self.root
+        node.visits += self.virtual_loss
+        made = 0
+        while True:
+            if node.untried is None:
+                node.untried = game.legal_actions() if not game.is_over() else []
+            while node.untried:
+                action = node.untried.pop(self.rng.integers(len(node.untried)))
+                if game.make(action, redoable=False):
+                    child = Node(action, node, game.current_team)
+                    node.children.append(child)
+                    child.visits += self.virtual_loss
+                    return child, made + 1
+            if not node.children:
+                return node, made
+            child = node.uct_child(self.exploration)
+            if not game.make(child.action, redoable=False):
+                # Huts and region ids are drawn from np.random, so the same actions can lead to
+                # another position in which this one is illegal. The branch is dropped.
+                node.children.remove(child)
+                continue
+            node = child
+            node.visits += self.virtual_loss
+            made += 1
+
+    def backup(self, node: Node, shares: np.ndarray) -> None:
+        while node is not None:
+            node.visits += 1 - self.virtual_loss
+            if node.team is not None:
+                node.value += shares[node.team]
+            node = node.parent
+
+    def run(self, rollouts: int = None, seconds: float = None) -> None:
+        game = self.game
+        deadline = None if seconds is None else time.perf_counter() + seconds
+        while (rollouts is None or self.rollouts < rollouts) and (deadline is None or time.perf_counter() < deadline):
+            # Select a batch of leaves first, the virtual loss steers later selections elsewhere
+            leaves = []
+            for _ in range(self.batch_size if rollouts is None else min(self.batch_size, rollouts - self.rollouts)):
+                node, made = self.select()
+                made += light_playout(game, self.rng, self.playout_turns)
+                leaves.append((node, land_shares(game)))
+                for _ in range(made):
+                    game.unmake()
+            for node, shares in leaves:
+                self.backup(node, shares)
+            self.rollouts += len(leaves)
+
+    def root_statistics(self) -> Dict[Action, Tuple[int, float]]:
+        return {child.action: (child.visits, child.value) for child in self.root.children}
+
+def search_worker(record: np.ndarray, size: Tuple[int, int], seed: int, rollouts: Optional[int], seconds: Optional[float],
+                  exploration: float, playout_turns: int, virtual_loss: int, batch_size: int) -> Tuple[Dict[Action, Tuple[int, float]], int]:
+    # Search from a position shipped as an archive record, returns the root statistics by action
+    # and the number of rollouts
+    np.random.seed(seed)
+    game = Game.from_record(Map(size=size), record)
+    search = TreeSearch(game, np.random.default_rng(seed), exploration, playout_turns, virtual_loss, batch_size)
+    search.run(rollouts, seconds)
+    return search.root_statistics(), search.rollouts
+
+class MCTSAgent(Agent):
+    '''
+    Searches every action with MCTS, within a time budget (seconds) or a rollout budget. The
+    rollout rate of the last search is kept in last_stats, so the agent doubles as a benchmark
+    of the rules engine.
+    '''
+
+    def __init__(self, seed: int = None, seconds: float = None, rollouts: int = 200, workers: int = 1,
+                 exploration: float = 1.4, playout_turns: int = 2, virtual_loss: int = 1, batch_size: int = 4):
+        if seconds is None and rollouts is None:
+            raise ValueError("MCTSAgent needs a time or rollout budget!")
+        if virtual_loss < 1:
+            raise ValueError(f"Virtual loss must be at least 1, got {virtual_loss}!")
+        self.rng = np.random.default_rng(seed)
+        self.seconds = seconds
+        self.rollouts = rollouts
+        self.workers = workers
+        self.exploration = exploration
+        self.playout_turns = playout_turns
+        self.virtual_loss = virtual_loss
+        self.batch_size = batch_size
+        self.executor = None
+        self.last_stats = {}
+
+    def close(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def select_action(self, game: Game) -> Action:
+        start = time.perf_counter()
+        seeds = self.rng.integers(2**32, size=self.workers)
+        rollouts = None if self.rollouts is None else max(self.rollouts // self.workers, 1)
+        settings = (self.exploration, self.playout_turns, self.virtual_loss, self.batch_size)
+        if self.workers == 1:
+            # Search in process on the game itself, make/unmake leaves it as it was
+            state = np.random.get_state()
+            search = TreeSearch(game, np.random.default_rng(seeds[0]), *settings)
+            search.run(rollouts, self.seconds)
+            np.random.set_state(state)
+            results = [(search.root_statistics(), search.rollouts)]
+        else:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            record = game.to_record()
+            futures = [self.executor.submit(search_worker, record, game.get_map().get_size(), int(seed),
+                                            rollouts, self.seconds, *settings) for seed in seeds]
+            results = [future.result() for future in futures]
+
+        visits: Dict[Action, int] = {}
+        for statistics, _ in results:
+            for action, (count, value) in statistics.items():
+                visits[action] = visits.get(action, 0) + count
+        total = sum(count for _, count in results)
+        seconds = time.perf_counter() - start
+        self.last_stats = {"rollouts": total, "seconds": seconds, "rollouts_per_second": total / seconds if seconds > 0 else 0.0}
+        if not visits:
+            return END_TURN
+        return max(visits.items(), key=lambda item: item[1])[0]
+
+if __name__ == '__main__':
+    from simulate import make_random_game
+    parser = argparse.ArgumentParser(description="Measure MCTS rollouts per second")
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--rows", type=int, default=20)
+    parser.add_argument("--cols", type=int, default=10)
+    args = parser.parse_args()
+    game = make_random_game((args.rows, args.cols), 2, seed=0)
+    for workers in args.workers:
+        agent = MCTSAgent(seed=0, seconds=args.seconds, rollouts=None, workers=workers)
+        action = agent.select_action(game)
+        agent.close()
+        print(f"{workers} workers: {agent.last_stats['rollouts']} rollouts in {agent.last_stats['seconds']:.2f}s, "
+              f"{agent.last_stats['rollouts_per_second']:.1f} rollouts/s, chose {action}")
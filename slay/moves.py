@@ -0,0 +1,130 @@
+from typing import Dict, List
+from piece import Piece, Soldier1, PIECE_TYPES, NO_PIECE
+from action import Action, ActionType, END_TURN
+from board import PIECE_POWER
+import numpy as np
+
+PIECE_UPGRADEABLE = np.zeros(max(PIECE_TYPES) + 1, dtype=bool)
+for kind, piece_type in PIECE_TYPES.items():
+    PIECE_UPGRADEABLE[kind] = piece_type.upgradeable
+PURCHASABLE_KINDS = sorted(kind for kind, piece_type in PIECE_TYPES.items() if piece_type.purchasable)
+TREE_KIND = next(kind for kind, piece_type in PIECE_TYPES.items() if piece_type.name == "palmtree")
+
+class RegionMoves:
+    '''
+    Every cell a region can put a piece on, grouped by the power of the piece. A soldier of power p
+    may take any bordering cell whose protection is below p, or move onto a cell of its own region
+    which is empty, holds a tree, or holds a soldier it can combine with. Forts may only be built on
+    empty cells of the region.
+    '''
+
+    def __init__(self, indices: np.ndarray, kinds: np.ndarray, border: np.ndarray, border_protection: np.ndarray):
+        self.indices = indices
+        self.border = border
+        self.border_protection = border_protection
+        soldier = PIECE_UPGRADEABLE[kinds]
+        free = (kinds == NO_PIECE) | (kinds == TREE_KIND)
+        self.fort_targets = indices[kinds == NO_PIECE]
+        self.targets: Dict[int, np.ndarray] = {}
+        for power in range(1, Piece.MAX_SOLDIER_LEVEL + 1):
+            inside = free | (soldier & (PIECE_POWER[kinds] + power <= Piece.MAX_SOLDIER_LEVEL))
+            self.targets[power] = np.concatenate([indices[inside], border[border_protection < power]])
+
+class MoveGenerator:
+    '''
+    Generates every legal action of a team. The moves of each region are cached and only
+    recomputed for regions near cells whose team or piece changed since the last query, which the
+    board records in board.changed. Captures are checked against the board's defense raster.
+    '''
+
+    def __init__(self, game):
+        self.game = game
+        self.board = game.get_map().board
+        self.cache: Dict[int, RegionMoves] = {}
+        self.board.changed.clear()
+
+    def neighborhood(self, indices: np.ndarray) -> np.ndarray:
+        # The given cells and all of their neighbors
+        neighbors = self.board.neighbors[indices].ravel()
+        return np.unique(np.concatenate([indices, neighbors[neighbors >= 0]]))
+
+    def refresh(self) -> None:
+        # Drop the cached moves of regions near the cells changed since the last call
+        board = self.board
+        if len(board.changed) == 0:
+            return
+        changed = np.fromiter(board.changed, dtype=np.int64, count=len(board.changed))
+        board.changed.clear()
+        # A piece protects its neighbors, and the moves of a region depend on the protection of
+        # the cells bordering it, so regions up to two cells away have to be recomputed
+        stale = board.region_id[self.neighborhood(self.neighborhood(changed))]
+        for region_id in np.unique(stale).tolist():
+            self.cache.pop(region_id, None)
+        for region_id in [region_id for region_id in self.cache if region_id not in self.game.regions]:
+            del self.cache[region_id]
+
+    def region_moves(self, region) -> RegionMoves:
+        self.refresh()
+        moves = self.cache.get(region.get_id())
+        if moves is None:
+            board = self.board
+            indices = np.sort(board.indices(region.tile_coords))
+            border = self.neighborhood(indices)
+            border = border[board.active[border] & (board.team[border] != region.get_team())]
+            moves = RegionMoves(indices, board.piece[indices].copy(), border, board.protection(border))
+            self.cache[region.get_id()] = moves
+        return moves
+
+    def target_mask(self, team: int = None) -> np.ndarray:
+        # Mask of the cells the team (by default the team to move) can move or buy a piece onto
+        game = self.game
+        team = game.current_team if team is None else team
+        mask = np.zeros(len(self.board), dtype=bool)
+        for region in game.get_team_regions(team):
+            if len(region.pieces) == 0:
+                continue
+            moves = self.region_moves(region)
+            for coord, piece in region.pieces.items():
+                if piece.moveable and coord not in game.moved:
+                    targets = moves.targets[piece.power]
+                    mask[targets[targets != self.board.index(coord)]] = True
+            if not region.contains_hut():
+                continue
+            for kind in PURCHASABLE_KINDS:
+                piece_type = PIECE_TYPES[kind]
+                if region.get_balance() >= piece_type.initial_cost:
+                    mask[moves.targets[piece_type.power] if piece_type.moveable else moves.fort_targets] = True
+        return mask
+
+    def legal_actions(self, team: int = None) -> List[Action]:
+        # Every action the team (by default the team to move) can take right now, ending with END_TURN
+        game = self.game
+        board = self.board
+        team = game.current_team if team is None else team
+        actions = []
+        for region in game.get_team_regions(team):
+            if len(region.pieces) == 0:
+                continue
+            moves = self.region_moves(region)
+            for source, piece in region.pieces.items():
+                if piece.moveable and source not in game.moved:
+                    source_index = board.index(source)
+                    for index in moves.targets[piece.power].tolist():
+                        if index != source_index:
+                            actions.append(Action(ActionType.MOVE, source=source, target=board.coord(index)))
+            if not region.contains_hut():
+                continue
+            source = region.get_hut_coord()
+            balance = region.get_balance()
+            for kind in PURCHASABLE_KINDS:
+                piece_type = PIECE_TYPES[kind]
+                if balance >= piece_type.initial_cost:
+                    targets = moves.targets[piece_type.power] if piece_type.moveable else moves.fort_targets
+                    for index in targets.tolist():
+                        actions.append(Action(ActionType.BUY, source=source, target=board.coord(index), piece_kind=kind))
+            if balance >= Soldier1.initial_cost:
+                for coord, piece in region.pieces.items():
+                    if piece.upgradeable and piece.power < Piece.MAX_SOLDIER_LEVEL:
+                        actions.append(Action(ActionType.UPGRADE, source=coord))
+        actions.append(END_TURN)
+        return actions
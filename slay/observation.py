@@ -0,0 +1,104 @@
+'''
+Observation tensors for learning agents. A game is encoded as a stack of (rows, cols) planes:
+
+    active          1 on land
+    team            one plane per team, rotated so the first plane is the team to move
+    piece           one plane per piece kind
+    region          dense index of each cell's region (1, 2, ...), 0 off land
+    balance         balance of each cell's region
+    legal           1 on cells the team to move can move or buy a piece onto
+
+Planes are filled straight from the board arrays into preallocated float32 buffers, and a batch
+of games is encoded with one pass over stacked board arrays rather than a loop over cells.
+'''
+
+from typing import List, Sequence, Tuple
+from piece import PIECE_TYPES
+import numpy as np
+
+def region_arrays(game) -> Tuple[np.ndarray, np.ndarray]:
+    # Dense region index and region balance of every cell
+    board = game.get_map().board
+    region_ids = np.array(list(game.regions.keys()), dtype=np.int64)
+    balances = np.array([region.get_balance() for region in game.regions.values()], dtype=np.float32)
+    order = np.argsort(region_ids)
+    region_ids, balances = region_ids[order], balances[order]
+    in_region = board.region_id != board.NO_REGION
+    position = np.searchsorted(region_ids, board.region_id)
+    position[~in_region] = 0
+    dense = np.where(in_region, position + 1, 0)
+    balance = np.where(in_region, balances[position] if len(balances) else 0, 0)
+    return dense, balance
+
+class ObservationEncoder:
+    '''
+    Encodes games played on boards of one size with a fixed number of teams. The buffer a game
+    is encoded into is reused between calls unless another one is passed in.
+    '''
+
+    def __init__(self, size: Tuple[int, int], num_players: int):
+        self.size = size
+        self.num_players = num_players
+        self.num_kinds = max(PIECE_TYPES)
+        self.ACTIVE = 0
+        self.TEAM = 1
+        self.PIECE = self.TEAM + num_players
+        self.REGION = self.PIECE + self.num_kinds
+        self.BALANCE = self.REGION + 1
+        self.LEGAL = self.BALANCE + 1
+        self.num_channels = self.LEGAL + 1
+        self.buffer = None
+        self.batch_buffer = None
+
+    def allocate(self, batch: int = None) -> np.ndarray:
+        shape = (self.num_channels,) + tuple(self.size)
+        if batch is not None:
+            shape = (batch,) + shape
+        return np.zeros(shape, dtype=np.float32)
+
+    def encode(self, game, out: np.ndarray = None) -> np.ndarray:
+        # Encode one game into a (C, H, W) array
+        if out is None:
+            if self.buffer is None:
+                self.buffer = self.allocate()
+            out = self.buffer
+        self.encode_batch([game], out[None])
+        return out
+
+    def encode_batch(self, games: Sequence, out: np.ndarray = None) -> np.ndarray:
+        # Encode B games into a (B, C, H, W) array
+        if out is None:
+            if self.batch_buffer is None or len(self.batch_buffer) != len(games):
+                self.batch_buffer = self.allocate(len(games))
+            out = self.batch_buffer
+        boards = [game.get_map().board for game in games]
+        if any(tuple(board.size) != tuple(self.size) for board in boards):
+            raise ValueError(f"Can only encode games on boards of size {self.size}!")
+        if out.shape != (len(games), self.num_channels) + tuple(self.size) or not out.flags.c_contiguous:
+            raise ValueError(f"Observations of {len(games)} games need a contiguous {(len(games), self.num_channels) + tuple(self.size)} buffer!")
+        active = np.stack([board.active for board in boards])
+        team = np.stack([board.team for board in boards])
+        piece = np.stack([board.piece for board in boards])
+        return self.encode_arrays(games, active, team, piece, out)
+
+    def encode_arrays(self, games: Sequence, active: np.ndarray, team: np.ndarray, piece: np.ndarray, out: np.ndarray) -> np.ndarray:
+        # Encode B games whose cells are given as (B, N) arrays, e.g. rows of boards which already
+        # share stacked storage, so the cells are not copied before encoding
+        planes = out.reshape(len(games), self.num_channels, -1)
+        team = team.astype(np.int64)
+        current = np.array([game.current_team for game in games])
+        regions = [region_arrays(game) for game in games]
+
+        planes[:, self.ACTIVE] = active
+        relative = np.where(team >= 0, (team - current[:, None]) % self.num_players, -1)
+        planes[:, self.TEAM:self.PIECE] = relative[:, None, :] == np.arange(self.num_players)[None, :, None]
+        planes[:, self.PIECE:self.REGION] = piece[:, None, :] == np.arange(1, self.num_kinds + 1)[None, :, None]
+        planes[:, self.REGION] = np.stack([dense for dense, balance in regions])
+        planes[:, self.BALANCE] = np.stack([balance for dense, balance in regions])
+        planes[:, self.LEGAL] = np.stack([game.moves.target_mask() for game in games])
+        return out
+
+    def channel_names(self) -> List[str]:
+        names = ["active"] + [f"team{team}" for team in range(self.num_players)]
+        names += [PIECE_TYPES[kind].name if kind in PIECE_TYPES else f"kind{kind}" for kind in range(1, self.num_kinds + 1)]
+        return names + ["region", "balance", "legal"]
@@ -24,6 +24,12 @@ class Piece(ABC):
     def name(self) -> str:
         ...
 
+    @property
+    @abstractclassmethod
+    def kind(self) -> int:
+        # Stable integer code of the piece type, used in board arrays and saved maps. 0 means no piece.
+        ...
+
     @property
     @abstractclassmethod
     def moveable(self) -> bool:
@@ -53,6 +59,7 @@ class Piece(ABC):
     #      so that other pieces can be made in the future
 
 class Hut(Piece):
+    kind = 1
     power = 1
     name = "hut"
     moveable = False
@@ -62,6 +69,7 @@ class Hut(Piece):
     upgradeable = False
 
 class Fort(Piece):
+    kind = 2
     power = 2
     name = "fort"
     moveable = False
@@ -71,6 +79,7 @@ class Fort(Piece):
     upgradeable = False
 
 class Soldier1(Piece):
+    kind = 3
     power = 1
     name = "soldier1"
     moveable = True
@@ -80,6 +89,7 @@ class Soldier1(Piece):
     upgradeable = True
 
 class Soldier2(Piece):
+    kind = 4
     power = 2
     name = "soldier2"
     moveable = True
@@ -88,11 +98,44 @@ class Soldier2(Piece):
     purchasable = True
     upgradeable = True
 
+class Soldier3(Piece):
+    kind = 6
+    power = 3
+    name = "soldier3"
+    moveable = True
+    turn_cost = 18
+    initial_cost = 30
+    purchasable = True
+    upgradeable = True
+
+class Soldier4(Piece):
+    kind = 7
+    power = 4
+    name = "soldier4"
+    moveable = True
+    turn_cost = 54
+    initial_cost = 40
+    purchasable = True
+    upgradeable = True
+
 class PalmTree(Piece):
+    kind = 5
     power = 0
     name = "palmtree"
     moveable = False
     turn_cost = 1
     initial_cost = 0
     purchasable = False
-    upgradeable = False
\ No newline at end of file
+    upgradeable = False
+
+NO_PIECE = 0
+PIECE_TYPES = {piece_type.kind: piece_type for piece_type in [Hut, Fort, Soldier1, Soldier2, Soldier3, Soldier4, PalmTree]}
+SOLDIER_TYPES = {piece_type.power: piece_type for piece_type in [Soldier1, Soldier2, Soldier3, Soldier4]}
+
+def piece_from_kind(kind: int) -> Piece:
+    if kind == NO_PIECE:
+        return None
+    return PIECE_TYPES[kind]()
+
+def soldier_from_level(level: int) -> Piece:
+    return SOLDIER_TYPES[level]()
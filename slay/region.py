@@ -1,7 +1,7 @@
-from typing import List, Tuple
+from typing import List, Tuple, Set, Dict
 from piece import *
 from map import Map
-from queue import PriorityQueue
+from collections import deque
 import numpy as np
 
 class RegionConfig:
@@ -16,10 +16,17 @@ class Region:
 
     def __init__(self, map: Map=None, tile_coords: List[Tuple[int, int]] = [], initialize: bool=True, id: int=0, team: int=None):
         self.map = map
-        self.tile_coords = tile_coords
-        self.pieces = {}
+        self.tiles: Set[Tuple[int, int]] = set(tile_coords)
+        self.pieces: Dict[Tuple[int, int], Piece] = {}
+        self.piece_index: Dict[str, Set[Tuple[int, int]]] = {} # piece name -> coordinates of those pieces
         self.id = id
         self.team = team
+        self.balance = 0
+
+        # The board's region id array is the index from tiles to regions, keep it in sync
+        if self.map is not None and len(self.tiles) > 0:
+            board = self.map.board
+            board.set_region_ids(board.indices(list(self.tiles)), self.id)
         
         if initialize:
             self.initialize_region()
@@ -27,31 +34,53 @@ class Region:
     def __eq__(self, other: 'Region') -> bool:
         return self.id == other.id
 
+    @property
+    def tile_coords(self) -> List[Tuple[int, int]]:
+        return list(self.tiles)
+
     def add_tile(self, tile_coord: Tuple[int, int]) -> None:
         if not self.contains_tile(tile_coord):
-            self.tile_coords.append(tile_coord)
+            self.tiles.add(tile_coord)
+            self.map.board.journal.record(self.tiles.discard, tile_coord)
+            self.map.get_tile(tile_coord).set_region_id(self.id)
+
+    def add_tiles(self, tile_coords: List[Tuple[int, int]]) -> None:
+        if len(tile_coords) > 0:
+            board = self.map.board
+            board.journal.record(self.tiles.difference_update, [coord for coord in tile_coords if coord not in self.tiles])
+            self.tiles.update(tile_coords)
+            board.set_region_ids(board.indices(tile_coords), self.id)
 
     def remove_tile(self, tile_coord: Tuple[int, int]) -> None:
         if self.contains_tile(tile_coord):
-            self.tile_coords.remove(tile_coord)
+            self.tiles.remove(tile_coord)
+            self.map.board.journal.record(self.tiles.add, tile_coord)
+            tile = self.map.get_tile(tile_coord)
+            if tile.get_region_id() == self.id:
+                tile.set_region_id(None)
 
     def contains_tile(self, tile_coord: Tuple[int, int]) -> bool:
-        return tile_coord in self.tile_coords
+        return tile_coord in self.tiles
 
     def contains_piece(self, tile_coord: Tuple[int, int]) -> bool:
-        return tile_coord in self.pieces.keys()
+        return tile_coord in self.pieces
 
     def contains_hut(self) -> bool:
-        for tile_coord in self.pieces.keys():
-            if self.pieces[tile_coord].name == "hut":
-                return True
-        return False
+        return len(self.piece_index.get("hut", ())) > 0
 
     def get_hut_coord(self) -> Tuple[int, int]:
-        for tile_coord in self.pieces.keys():
-            if self.pieces[tile_coord].name == "hut":
-                return tile_coord
-        raise Exception("Tried to get hut coordinate, but region did not contain hut!")
+        if not self.contains_hut():
+            raise Exception("Tried to get hut coordinate, but region did not contain hut!")
+        return next(iter(self.piece_index["hut"]))
+
+    def get_piece_coords(self, name: str) -> Set[Tuple[int, int]]:
+        return self.piece_index.get(name, set())
+
+    def get_soldier_coords(self, level: int) -> Set[Tuple[int, int]]:
+        return self.get_piece_coords(f"soldier{level}")
+
+    def get_tree_coords(self) -> Set[Tuple[int, int]]:
+        return self.get_piece_coords("palmtree")
 
     def get_piece(self, tile_coord: Tuple[int, int]) -> Piece:
         if self.contains_piece(tile_coord):
@@ -63,7 +92,7 @@ class Region:
         return self.team
 
     def get_size(self) -> int:
-        return len(self.tile_coords)
+        return len(self.tiles)
 
     def get_balance(self) -> int:
         return self.balance
@@ -72,17 +101,34 @@ class Region:
         return self.id
 
     def set_team(self, team: int) -> None:
+        if self.map is not None:
+            self.map.board.journal.record(self.set_team, self.team)
         self.team = team
 
     def set_balance(self, balance: int) -> None:
+        if self.map is not None:
+            self.map.board.journal.record(self.set_balance, self.balance)
         self.balance = balance
 
     def set_piece(self, tile_coord: Tuple[int, int], piece: Piece) -> None:
+        self.remove_piece(tile_coord)
         self.pieces[tile_coord] = piece
+        self.piece_index.setdefault(piece.name, set()).add(tile_coord)
+        board = self.map.board
+        board.journal.record(self.remove_piece, tile_coord)
+        index = board.index(tile_coord)
+        board.piece[index] = piece.kind
+        board.touch(index)
 
     def remove_piece(self, tile_coord: Tuple[int, int]) -> None:
         if self.contains_piece(tile_coord):
-            del self.pieces[tile_coord]
+            piece = self.pieces.pop(tile_coord)
+            self.piece_index[piece.name].discard(tile_coord)
+            board = self.map.board
+            board.journal.record(self.set_piece, tile_coord, piece)
+            index = board.index(tile_coord)
+            board.piece[index] = NO_PIECE
+            board.touch(index)
 
     def get_all_piece_coords(self) -> List[Tuple[int, int]]: #TODO: Fix type signature, actually returns dict_keys
         return self.pieces.keys()
@@ -95,70 +141,61 @@ class Region:
         else:
             self.balance = 0
 
+    def get_tile_arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Sorted flat indices of the region's tiles, the power of the piece on each tile, and a
+        # mask of the tiles whose neighbors all belong to the region
+        board = self.map.board
+        indices = np.sort(board.indices(self.tile_coords))
+        power = np.zeros(len(indices), dtype=np.int8)
+        if len(self.pieces) > 0:
+            piece_indices = board.indices(list(self.pieces.keys()))
+            power[np.searchsorted(indices, piece_indices)] = [piece.power for piece in self.pieces.values()]
+        neighbors = board.neighbors[indices]
+        inside = np.all((neighbors >= 0) & (board.region_id[neighbors] == self.id), axis=1)
+        return indices, power, inside
+
     def add_hut(self):
         if self.get_size() > 1 and not self.contains_hut():
-            power_map = {tile_coord: 0 for tile_coord in self.tile_coords}
-            for tile_coord in self.pieces.keys():
-                power_map[tile_coord] = self.pieces[tile_coord].power
-            current_power = 0
-            while True:
-                current_power_tiles = list(filter(lambda tile_coord: power_map[tile_coord] == current_power, self.tile_coords))
-                if len(current_power_tiles) == 0:
-                    current_power += 1
-                else:
-                    inside_tiles = list(filter(lambda tile_coord: all(list(map(lambda neighbor_coord: neighbor_coord in self.tile_coords, self.map.get_tile(tile_coord).get_neighbors_coords()))), current_power_tiles))
-                    if len(inside_tiles) > 0:
-                        tile_coord = inside_tiles[np.random.randint(len(inside_tiles))]
-                        self.set_piece(tile_coord, Hut())
-                    else:
-                        border_tiles = []
-                        for tile_coord in current_power_tiles:
-                            if tile_coord not in inside_tiles:
-                                border_tiles.append(tile_coord)
-                        tile_coord = border_tiles[np.random.randint(len(border_tiles))]
-                        self.set_piece(tile_coord, Hut())
-                    break
+            # Place the hut on a tile with the weakest piece, preferring tiles inside the region
+            indices, power, inside = self.get_tile_arrays()
+            candidates = power == power.min()
+            if np.any(candidates & inside):
+                candidates &= inside
+            choices = indices[candidates]
+            tile_coord = self.map.board.coord(choices[np.random.randint(len(choices))])
+            self.set_piece(tile_coord, Hut())
         elif self.get_size() == 1 and self.contains_hut():
-            self.remove_piece(self.tile_coords[0])
-            self.set_piece(self.tile_coords[0], PalmTree())
+            self.set_piece(self.get_hut_coord(), PalmTree())
 
-    # TODO: Implement this function properly so it maintains invariances
     def eat_region(self, other: 'Region'):
-        for tile_coord in other.tile_coords:
-            tile = self.map.get_tile(tile_coord)
-            tile.set_region_id(self.id)
-            self.add_tile(tile_coord)
-        for tile_coord in other.pieces.keys():
-            if other.get_piece(tile_coord).name != "hut":
-                self.set_piece(tile_coord, other.get_piece(tile_coord))
+        # Only walks the other region, so merging a small region into a large one is cheap
+        self.add_tiles(list(other.tiles))
+        for tile_coord, piece in list(other.pieces.items()):
+            other.remove_piece(tile_coord)
+            if piece.name != "hut":
+                self.set_piece(tile_coord, piece)
         if other.get_size() > 1:
-            self.balance += other.get_balance()
+            self.set_balance(self.balance + other.get_balance())
 
     def check_valid_region(self) -> bool:
         return self.check_tile_same_team() and self.check_tile_connectivity()
 
     def check_tile_connectivity(self) -> bool:
-        if len(self.tiles > 1):
-            reached = {coord: False for coord in self.tile_coords}
-            queue = PriorityQueue()
-            queue.put((0, self.tile_coords[0]))
-            while queue.not_empty():
-                priority, tile_coord = queue.get()
-                tile = self.map.get_tile(tile_coord)
-                neighbor_coords = tile.get_neighbors_coords()
-                for coord in neighbor_coords:
-                    if coord in self.tile_coords:
-                        reached[coord] = True
-                        queue.put((priority+1, coord))
-            for coord in self.tile_coords:
-                if not reached[coord]:
-                    return False
+        if self.get_size() > 1:
+            start = next(iter(self.tiles))
+            reached = {start}
+            q = deque([start])
+            while q:
+                tile_coord = q.popleft()
+                for coord in self.map.get_neighbors_coords(tile_coord):
+                    if coord in self.tiles and coord not in reached:
+                        reached.add(coord)
+                        q.append(coord)
+            return len(reached) == self.get_size()
         return True
 
     def check_tile_same_team(self) -> bool:
-        if len(self.tiles >= 1):
-            team = self.tiles[0].team
-            for idx in range(1, len(self.tiles)):
-                if self.tiles[idx].team != team:
-                    return False
-        return True
\ No newline at end of file
+        if self.get_size() >= 1:
+            board = self.map.board
+            return bool(np.all(board.team[board.indices(self.tile_coords)] == self.team))
+        return True
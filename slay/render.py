@@ -1,13 +1,18 @@
-from typing import Tuple
-from tile import TileType, Tile
+from typing import Dict, List, Tuple
+from collections import OrderedDict
+from tile import TileType, Tile, TileGeometry
 from piece import *
 from region import Region
 from grid import HexGrid, Grid
 from game import Game
+from action import Action, ActionType, END_TURN
+from async_agent import AsyncAgent
 from map import Map
 from config import *
 import pygame
+import asyncio
 import json
+import time
 import numpy as np
 
 class TileAsset:
@@ -43,53 +48,130 @@ class TileAsset:
         return self.asset_json["edge"]
 
 class TextureAsset:
+    '''
+    Piece textures, packed side by side into one atlas surface when loaded. Pieces are drawn as
+    sub-rects of the atlas scaled to the current scale, and the most recently used scaled atlases
+    are kept, keyed by the scale rounded to scale_step, so resizing back and forth does not
+    rescale anything.
+    '''
 
-    def __init__(self, folder="default"):
+    def __init__(self, folder="default", cache_size: int = 8, scale_step: float = 0.25, padding: int = 2):
         self.folder_path = TEXTURE_ASSET_DIR.joinpath(folder)
-        self.piece_to_texture = {}
-        self.original_texture = {}
         self.scale = DEFAULT_TEXTURE_SCALE # All texture files must be made with scale=15
+        self.cache_size = cache_size
+        self.scale_step = scale_step
+        self.padding = padding # Transparent gap between textures, so scaling does not bleed
+        self.atlas: pygame.Surface = None
+        self.atlas_rects: Dict[str, pygame.Rect] = {}
+        self.scaled_atlases: OrderedDict = OrderedDict() # Rounded scale -> (atlas, rects by name)
+
+    def load(self) -> None:
+        # Load every piece texture into the atlas. Needs a display mode to be set.
+        textures = {}
+        for kind in sorted(PIECE_TYPES):
+            piece = PIECE_TYPES[kind]()
+            path = self.folder_path.joinpath(f'{piece.name}.png')
+            textures[piece.name] = pygame.image.load(path) if path.exists() else self.make_placeholder_texture(piece)
+        width = sum(texture.get_width() + self.padding for texture in textures.values())
+        height = max(texture.get_height() for texture in textures.values())
+        self.atlas = pygame.Surface((width, height), pygame.SRCALPHA)
+        self.atlas_rects = {}
+        left = 0
+        for name, texture in textures.items():
+            self.atlas_rects[name] = self.atlas.blit(texture, (left, 0))
+            left += texture.get_width() + self.padding
+        self.atlas = self.atlas.convert_alpha()
+        self.scaled_atlases.clear()
+
+    def make_placeholder_texture(self, piece: Piece) -> pygame.Surface:
+        # Pieces without a texture file are drawn as a disc, one ring per level of power
+        size = int(DEFAULT_TEXTURE_SCALE * 1.5)
+        surface = pygame.Surface((size, size), pygame.SRCALPHA)
+        center = (size//2, size//2)
+        pygame.draw.circle(surface, (40, 40, 40), center, size//2, 0)
+        for level in range(max(piece.power, 1)):
+            pygame.draw.circle(surface, (230, 230, 230), center, size//2 - 2*level, 1)
+        return surface
+
+    def make_scaled_atlas(self, scale: float) -> Tuple[pygame.Surface, Dict[str, pygame.Rect]]:
+        ratio = scale/DEFAULT_TEXTURE_SCALE
+        width, height = self.atlas.get_size()
+        atlas = pygame.transform.scale(self.atlas, (max(round(width*ratio), 1), max(round(height*ratio), 1)))
+        rects = {}
+        for name, rect in self.atlas_rects.items():
+            left, top = round(rect.left*ratio), round(rect.top*ratio)
+            rects[name] = pygame.Rect(left, top, max(round(rect.right*ratio) - left, 1), max(round(rect.bottom*ratio) - top, 1))
+        return atlas, rects
+
+    def get_scaled_atlas(self) -> Tuple[pygame.Surface, Dict[str, pygame.Rect]]:
+        if self.atlas is None:
+            self.load()
+        key = round(self.scale/self.scale_step) * self.scale_step
+        if key in self.scaled_atlases:
+            self.scaled_atlases.move_to_end(key)
+        else:
+            self.scaled_atlases[key] = self.make_scaled_atlas(key)
+            if len(self.scaled_atlases) > self.cache_size:
+                self.scaled_atlases.popitem(last=False)
+        return self.scaled_atlases[key]
+
+    def get_piece_sprite(self, piece: Piece) -> Tuple[pygame.Surface, pygame.Rect]:
+        # Scaled atlas and the area of the piece's texture on it, for blitting with an area
+        atlas, rects = self.get_scaled_atlas()
+        return atlas, rects[piece.name]
 
     def get_piece_texture(self, piece: Piece) -> pygame.Surface:
-        name = piece.name
-        if name not in self.piece_to_texture:
-            surface = pygame.image.load(self.folder_path.joinpath(f'{name}.png'))
-            self.original_texture[name] = surface
-            self.piece_to_texture[name] = self.make_piece_texture(name)
-        return self.piece_to_texture[name]
-
-    def make_piece_texture(self, name: str) -> None:
-        surface = self.original_texture[name]
-        size = surface.get_size()
-        scaling_ratio = self.scale/DEFAULT_TEXTURE_SCALE
-        new_size = (size[0]*scaling_ratio, size[1]*scaling_ratio)
-        return pygame.transform.scale(surface, new_size)
+        atlas, rect = self.get_piece_sprite(piece)
+        return atlas.subsurface(rect)
 
     def set_scale(self, scale: float) -> None:
         self.scale = scale
-        for name in self.piece_to_texture.keys():
-            self.piece_to_texture[name] = self.make_piece_texture(name)
 
 class Render:
+    '''
+    Draws a game in three layers: terrain (tiles coloured by team), an overlay (selection border
+    and attackable cells) and pieces. Each layer is kept on its own surface and only the tiles,
+    pieces and overlay marks which changed since the last frame are redrawn. The display is then
+    recomposed and updated inside those dirty rectangles only.
+    '''
 
-    def __init__(self, screen_size: Tuple[int, int], game: Game):
+    def __init__(self, screen_size: Tuple[int, int], game: Game, fps: int = 60):
         self.screen_size = screen_size
         self.game = game
         self.x_margin = 0.1
+        self.fps = fps # Frame rate limit, None or 0 for no limit
+        self.clock = pygame.time.Clock()
 
         self.grid = self.make_grid()
+        self.geometry = self.make_geometry()
         self.background_color = (0, 0, 0)
 
         self.tile_asset = TileAsset()
         self.texture_asset = TextureAsset()
 
         self.selected_region_id = None
+        self.selected_tile = None
+        self.agent_teams = set() # Teams played by an agent, mouse and keyboard can not act for them
+
+        # Layers and what they were last drawn from, rebuilt from scratch when stale
+        self.stale = True
+        self.terrain: pygame.Surface = None
+        self.overlay: pygame.Surface = None
+        self.pieces: pygame.Surface = None
+        self.drawn_active: np.ndarray = None
+        self.drawn_team: np.ndarray = None
+        self.drawn_piece: np.ndarray = None
+        self.tile_rects: Dict[int, pygame.Rect] = {}
+        self.piece_rects: Dict[int, pygame.Rect] = {}
+        self.overlay_rects: List[pygame.Rect] = []
+        self.overlay_key = None
 
         self.initialize_pygame()
 
     def initialize_pygame(self) -> None:
         pygame.init()
         self.display = pygame.display.set_mode(self.screen_size, pygame.RESIZABLE)
+        self.texture_asset.load()
 
     def make_grid(self) -> Grid:
         tile_rows, tile_cols = self.game.get_map().get_size()
@@ -103,82 +185,186 @@ class Render:
             top_left = (self.screen_size[0]/2 - width/2, self.screen_size[1]/2 - height/2)
             return HexGrid(rows=rows, cols=cols, top_left=top_left, scale=scale)
 
-    def draw_grid(self, grid_color: Tuple[int, int, int], radius: int=3):
-        for row in self.grid.grid:
-            for point in row:
-                pygame.draw.circle(self.display, grid_color, point, radius, 0)
+    def make_geometry(self) -> TileGeometry:
+        # Shapes of all tiles on the current grid, which the drawing and picking code reads from
+        map_ = self.game.get_map()
+        return Tile.get_tile_constructor(map_.get_tile_type()).make_geometry(map_.get_size(), self.grid)
 
-    def draw_tile(self, tile: Tile, tile_asset: TileAsset, edge_thickness=2) -> None:
+    def draw_tile(self, tile: Tile, tile_asset: TileAsset, edge_thickness=2, surface: pygame.Surface = None,
+                  offset: Tuple[int, int] = (0, 0)) -> pygame.Rect:
+        # Returns the area drawn over
+        surface = surface or self.display
         if tile.is_active():
-            shape, center = tile.get_shape(self.grid)
+            shape = (self.geometry.vertices[tile.index] + offset).tolist()
             team = tile.get_team()
-            pygame.draw.polygon(self.display, tile_asset.get_team_color(team), shape, 0)
-            pygame.draw.polygon(self.display, tile_asset.get_edge_color(), shape, edge_thickness)
+            rect = pygame.draw.polygon(surface, tile_asset.get_team_color(team), shape, 0)
+            return rect.union(pygame.draw.polygon(surface, tile_asset.get_edge_color(), shape, edge_thickness))
+        return None
 
-    def draw_piece(self, tile_coord: Tuple[int, int], piece: Piece, texture_asset: TextureAsset) -> None:
+    def piece_rect(self, tile_coord: Tuple[int, int], piece: Piece) -> pygame.Rect:
+        # Area covered by the texture of a piece, which sticks out above its tile
+        center = self.geometry.centers[self.game.get_map().board.index(tile_coord)]
+        atlas, texture_rect = self.texture_asset.get_piece_sprite(piece)
+        width, height = texture_rect.size
+        return pygame.Rect(int(center[0] - width/2), int(center[1] - height * (0.5 + 0.25)), width, height)
+
+    def draw_piece(self, tile_coord: Tuple[int, int], piece: Piece, texture_asset: TextureAsset, surface: pygame.Surface = None) -> None:
+        surface = surface or self.display
         tile = self.game.get_map().get_tile(tile_coord)
         if tile.is_active():
-            shape, center = tile.get_shape(self.grid)
-            texture = texture_asset.get_piece_texture(piece)
-            texture_size = texture.get_size()
-            top_left = (center[0] - texture_size[0]/2, center[1] - texture_size[1] * (0.5 + 0.25))
-            self.display.blit(texture, top_left)
+            center = self.geometry.centers[tile.index]
+            atlas, texture_rect = texture_asset.get_piece_sprite(piece)
+            texture_size = texture_rect.size
+            top_left = (int(center[0] - texture_size[0]/2), int(center[1] - texture_size[1] * (0.5 + 0.25)))
+            surface.blit(atlas, top_left, texture_rect)
 
-    def draw_region_border(self, region: Region) -> None:
+    def draw_region_border(self, region: Region, surface: pygame.Surface = None) -> List[pygame.Rect]:
+        # Returns the areas drawn over
+        surface = surface or self.display
+        rects = []
         if region.get_id() == self.selected_region_id:
             map_ = self.game.get_map()
-            home = region.get_team()
-            for tile_coord in region.tile_coords:
-                tile = map_.get_tile(tile_coord)
-                for neighbor_coord in tile.get_neighbors_coords():
-                    if not map_.is_valid_tile_coords(neighbor_coord) or map_.get_tile(neighbor_coord).get_team() != home:
-                        edge = tile.get_edge_from_neighbor(neighbor_coord, self.grid)
-                        pygame.draw.line(self.display, (255, 255, 255), edge[0], edge[1], 2)
-
-    def draw_region_pieces(self, region: Region) -> None:
-        for piece_coord in region.get_all_piece_coords():
-            piece = region.get_piece(piece_coord)
-            self.draw_piece(piece_coord, piece, self.texture_asset)
-
-    def draw_game(self) -> None:
+            indices = map_.board.indices(region.tile_coords)
+            # A border edge is any edge whose neighbor is off the board or on another team
+            border = ~map_.same_team_neighbor_mask(indices)
+            for index, directions in zip(indices, border):
+                for edge in self.geometry.edges[index, directions].tolist():
+                    rects.append(pygame.draw.line(surface, (255, 255, 255), edge[0], edge[1], 2))
+        return rects
+
+    def draw_attackable(self, radius: int = 3, surface: pygame.Surface = None) -> List[pygame.Rect]:
+        # Mark the cells the selected soldier (or a new soldier of the selected region) could take.
+        # Returns the areas drawn over.
+        surface = surface or self.display
+        if self.selected_tile is None:
+            return []
+        region = self.game.get_region(self.selected_tile)
+        if region is None or region.get_team() != self.game.current_team:
+            return []
+        piece = region.get_piece(self.selected_tile)
+        power = piece.power if piece is not None and piece.moveable else Soldier1.power
+        map_ = self.game.get_map()
+        board = map_.board
+        neighbors = board.neighbors[board.indices(region.tile_coords)].ravel()
+        border = np.unique(neighbors[neighbors >= 0])
+        rects = []
+        for index in border[board.attackable(region.get_team(), power)[border]]:
+            rects.append(pygame.draw.circle(surface, (255, 255, 255), self.geometry.centers[index].tolist(), radius, 0))
+        return rects
+
+    def draw_overlay(self, surface: pygame.Surface = None) -> List[pygame.Rect]:
+        rects = []
         for region in self.game.regions.values():
-            self.draw_region_border(region)
-        for region in self.game.regions.values(): 
-            self.draw_region_pieces(region)
+            rects += self.draw_region_border(region, surface)
+        return rects + self.draw_attackable(surface=surface)
 
-    def draw_map(self) -> None:
-        for tile in self.game.get_map():
-            self.draw_tile(tile, self.tile_asset, edge_thickness=2)
+    def build_layers(self) -> None:
+        # Draw every layer from scratch, e.g. after the window was resized
+        size = self.display.get_size()
+        board = self.game.get_map().board
+        self.terrain = pygame.Surface(size).convert()
+        self.overlay = pygame.Surface(size, pygame.SRCALPHA)
+        self.pieces = pygame.Surface(size, pygame.SRCALPHA)
 
-    def find_closest_tile(self, pos: Tuple[int, int]) -> Tile:
+        # Bounding box of every tile with room for its outline
+        top_left = np.floor(self.geometry.vertices.min(axis=1)).astype(int) - 2
+        bottom_right = np.ceil(self.geometry.vertices.max(axis=1)).astype(int) + 2
+        self.tile_rects = {index: pygame.Rect(left, top, right - left, bottom - top)
+                           for index, ((left, top), (right, bottom)) in enumerate(zip(top_left.tolist(), bottom_right.tolist()))}
+        self.redraw_terrain(self.terrain.get_rect())
+        self.drawn_active = board.active.copy()
+        self.drawn_team = board.team.copy()
+
+        self.overlay_rects = self.draw_overlay(self.overlay)
+        self.overlay_key = (self.selected_region_id, self.selected_tile, self.game.current_team)
+
+        self.drawn_piece = board.piece.copy()
+        self.piece_rects = {}
+        for index in np.flatnonzero(board.active & (board.piece != NO_PIECE)):
+            self.piece_rects[index] = self.piece_rect(board.coord(index), piece_from_kind(board.piece[index]))
+        self.redraw_pieces(self.pieces.get_rect())
+        self.stale = False
+
+    def redraw_terrain(self, rect: pygame.Rect, radius: int = 3) -> None:
+        # Repaint the terrain layer inside rect: background, grid points, then every tile reaching
+        # into rect in map order, which gives the same pixels as drawing the whole map. Clipping
+        # changes how pygame draws thick outlines, so the tiles are drawn whole onto a scratch
+        # surface around rect, shifted by whole pixels, and only rect is copied back.
         map_ = self.game.get_map()
-        sqr_distances = {}
-        def get_tile_sqr_distance(tile: Tile):
-            tile_coords = tile.get_tile_coords()
-            if tile_coords not in sqr_distances.keys():
-                shape, center = tile.get_shape(self.grid)
-                sqr_distances[tile_coords] = (pos[0] - center[0]) ** 2 + (pos[1] - center[1]) ** 2
-            return sqr_distances[tile_coords]
-        
-        current_tile = map_.get_tile((map_.get_size()[0]//2, map_.get_size()[1]//2))
-        done = False
-        iter_ = 0
-        while not done:
-            iter_ += 1
-            neighbor_tiles = map(map_.get_tile, filter(map_.is_valid_tile_coords, current_tile.get_neighbors_coords()))
-            min_tile = None
-            for tile in neighbor_tiles:
-                if get_tile_sqr_distance(tile) < get_tile_sqr_distance(current_tile):
-                    if not min_tile or get_tile_sqr_distance(tile) < get_tile_sqr_distance(min_tile):
-                        min_tile = tile
-            if not min_tile:
-                done = True
-            else:
-                current_tile = min_tile
-        print(f"Used {iter_} iterations, calculated {len(sqr_distances.keys())} distances")
-        return current_tile
-        
+        indices = sorted(index for index, tile_rect in self.tile_rects.items() if tile_rect.colliderect(rect))
+        reach = radius + 2 # Points are rounded when drawn
+        area = rect.unionall([self.tile_rects[index] for index in indices]).inflate(2*reach, 2*reach)
+        scratch = pygame.Surface(area.size).convert()
+        scratch.fill(self.background_color)
+        points = self.grid.grid.reshape(-1, 2)
+        near = ((points[:, 0] >= rect.left - reach) & (points[:, 0] <= rect.right + reach)
+                & (points[:, 1] >= rect.top - reach) & (points[:, 1] <= rect.bottom + reach))
+        for x, y in points[near]:
+            pygame.draw.circle(scratch, (0, 255, 255), (x - area.x, y - area.y), radius, 0)
+        for index in indices:
+            self.draw_tile(map_.get_tile(map_.board.coord(index)), self.tile_asset, surface=scratch, offset=(-area.x, -area.y))
+        self.terrain.blit(scratch, rect, rect.move(-area.x, -area.y))
 
+    def update_terrain(self) -> List[pygame.Rect]:
+        # Redraw the tiles whose team changed, returns the dirty areas
+        board = self.game.get_map().board
+        changed = np.flatnonzero((board.team != self.drawn_team) | (board.active != self.drawn_active))
+        rects = [self.tile_rects[index] for index in changed]
+        for rect in rects:
+            self.redraw_terrain(rect)
+        self.drawn_active[changed] = board.active[changed]
+        self.drawn_team[changed] = board.team[changed]
+        return rects
+
+    def redraw_pieces(self, rect: pygame.Rect) -> None:
+        # Repaint the piece layer inside rect, in row order so lower pieces are drawn in front
+        board = self.game.get_map().board
+        self.pieces.set_clip(rect)
+        self.pieces.fill((0, 0, 0, 0))
+        for index in sorted(index for index, piece_rect in self.piece_rects.items() if piece_rect.colliderect(rect)):
+            self.draw_piece(board.coord(index), piece_from_kind(board.piece[index]), self.texture_asset, self.pieces)
+        self.pieces.set_clip(None)
+
+    def update_pieces(self) -> List[pygame.Rect]:
+        # Redraw the areas of pieces which appeared, moved or disappeared, returns the dirty areas
+        board = self.game.get_map().board
+        changed = np.flatnonzero(board.piece != self.drawn_piece)
+        rects = [self.piece_rects.pop(index) for index in changed if index in self.piece_rects]
+        for index in changed:
+            if board.active[index] and board.piece[index] != NO_PIECE:
+                self.piece_rects[index] = self.piece_rect(board.coord(index), piece_from_kind(board.piece[index]))
+                rects.append(self.piece_rects[index])
+        for rect in rects:
+            self.redraw_pieces(rect)
+        self.drawn_piece[changed] = board.piece[changed]
+        return rects
+
+    def update_overlay(self, board_changed: bool) -> List[pygame.Rect]:
+        # The overlay depends on the selection, the team to move and, through the attackable cells,
+        # the whole board, so it is redrawn whenever any of them changed. Returns the dirty areas.
+        key = (self.selected_region_id, self.selected_tile, self.game.current_team)
+        if not board_changed and key == self.overlay_key:
+            return []
+        rects = self.overlay_rects
+        for rect in rects:
+            self.overlay.fill((0, 0, 0, 0), rect)
+        self.overlay_rects = self.draw_overlay(self.overlay)
+        self.overlay_key = key
+        return rects + self.overlay_rects
+
+    def find_tile_indices(self, positions) -> np.ndarray:
+        # Flat index of the tile under each screen position, -1 off the board. Works on any number
+        # of positions at once, e.g. for hovering or drag selection.
+        map_ = self.game.get_map()
+        return Tile.get_tile_constructor(map_.get_tile_type()).pick_indices(map_.get_size(), self.grid, positions)
+
+    def find_closest_tile(self, pos: Tuple[int, int]) -> Tile:
+        # Tile under a screen position, or None off the board
+        index = self.find_tile_indices([pos])[0]
+        if index < 0:
+            return None
+        map_ = self.game.get_map()
+        return map_.get_tile(map_.board.coord(index))
 
     def event_handler(self):
         for event in pygame.event.get():
@@ -188,43 +374,109 @@ class Render:
             elif event.type == pygame.MOUSEBUTTONDOWN:
                 pos = pygame.mouse.get_pos()
                 button1, button2, button3, button4, button5 = pygame.mouse.get_pressed(num_buttons=5)
+                tile = self.find_closest_tile(pos)
+                if tile is None:
+                    continue
                 if button1:
-                    row1 = self.grid.grid[0][0:5]
-                    row2 = self.grid.grid[1][0:5]
-                    row3 = self.grid.grid[2][0:5]
-
-                    rows = row1 + row2 + row3
-                    #print(list(map(lambda x: float(f"{(x[0]-72)*20:.2f}"), rows)))
-                    #print(list(map(lambda x: float(f"{(x[1]-72)*20:.2f}"), rows)))
-                    selected_tile = self.find_closest_tile(pos).get_tile_coords()
-                    print(f"SELECTED TILE COORDS {selected_tile}")
+                    selected_tile = tile.get_tile_coords()
                     selected_region = self.game.get_region(selected_tile)
                     if selected_region:
                         self.selected_region_id = selected_region.get_id()
-                elif button3:
-                    selected_tile = self.find_closest_tile(pos)
-                    selected_region = self.game.get_region_by_id(self.selected_region_id)
-                    if any(map(selected_region.contains_tile, selected_tile.get_neighbors_coords())):
-                        piece = Soldier2()
-                        if self.game.check_valid_move(piece, selected_region, selected_tile.get_tile_coords()):
-                            self.selected_region_id = self.game.place_piece(piece, selected_region, selected_tile.get_tile_coords())
+                        self.selected_tile = selected_tile
+                elif button3 and self.selected_tile is not None and self.game.current_team not in self.agent_teams:
+                    # Move the selected soldier, or buy a new soldier with the selected region
+                    target = tile.get_tile_coords()
+                    selected_region = self.game.get_region(self.selected_tile)
+                    if selected_region is None:
+                        continue
+                    piece = selected_region.get_piece(self.selected_tile)
+                    if piece is not None and piece.moveable:
+                        action = Action(ActionType.MOVE, source=self.selected_tile, target=target)
+                    else:
+                        action = Action(ActionType.BUY, source=self.selected_tile, target=target, piece_kind=Soldier1.kind)
+                    if self.game.apply(action):
+                        self.selected_tile = target
+                        self.selected_region_id = self.game.get_region(target).get_id()
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_RETURN and self.game.current_team not in self.agent_teams:
+                self.game.apply(END_TURN)
+                self.selected_region_id, self.selected_tile = None, None
             elif event.type == pygame.VIDEORESIZE:
                 self.screen_size = event.dict['size']
                 self.grid = self.make_grid()
+                self.geometry = self.make_geometry()
                 self.texture_asset.set_scale(self.grid.scale)
-                pygame.display.update()
+                self.stale = True
             elif event.type == pygame.VIDEOEXPOSE:  # handles window minimising/maximising
                 self.screen_size = self.display.get_size()
                 self.grid = self.make_grid()
+                self.geometry = self.make_geometry()
                 self.texture_asset.set_scale(self.grid.scale)
-                pygame.display.update()
+                self.stale = True
+
+    def draw_frame(self) -> None:
+        if self.stale:
+            self.build_layers()
+            self.display.blit(self.terrain, (0, 0))
+            self.display.blit(self.overlay, (0, 0))
+            self.display.blit(self.pieces, (0, 0))
+            pygame.display.flip()
+            return
+        terrain_rects = self.update_terrain()
+        piece_rects = self.update_pieces()
+        rects = terrain_rects + piece_rects + self.update_overlay(bool(terrain_rects or piece_rects))
+        screen = self.display.get_rect()
+        rects = [rect.clip(screen) for rect in rects]
+        rects = [rect for rect in rects if rect.width and rect.height]
+        for rect in rects:
+            self.display.blit(self.terrain, rect, rect)
+            self.display.blit(self.overlay, rect, rect)
+            self.display.blit(self.pieces, rect, rect)
+        if rects:
+            pygame.display.update(rects)
+
+    def frame_delay(self, frame_start: float) -> float:
+        # Seconds left of a frame started at frame_start (perf_counter) under the frame rate limit
+        if not self.fps:
+            return 0.0
+        return max(1/self.fps - (time.perf_counter() - frame_start), 0.0)
 
     def main_loop(self):
         while True:
             self.event_handler()
-            self.display.fill(self.background_color) 
-            self.draw_grid(grid_color=(0, 255, 255), radius=3)
-            self.draw_map()
-            self.draw_game()
-            pygame.display.flip()
+            self.draw_frame()
+            self.clock.tick(self.fps or 0)
+
+    async def main_loop_async(self, agents: Dict[int, AsyncAgent], fps: int = None, deadline: float = 1.0):
+        # Teams with an agent are played by it, the others by mouse. Frames keep being drawn
+        # while an agent is thinking, since its answer is awaited between frames. An agent which
+        # does not answer within deadline seconds forfeits the move, as in play_game_async.
+        if fps is not None:
+            self.fps = fps
+        self.agent_teams = set(agents)
+        pending = None
+        while True:
+            frame_start = time.perf_counter()
+            self.event_handler()
+            if pending is not None and pending_for != (self.game.current_team, self.game.turn):
+                # The answer would be for a position which is gone
+                pending.cancel()
+                pending = None
+            agent = agents.get(self.game.current_team)
+            if agent is not None and not self.game.is_over():
+                if pending is None:
+                    pending = asyncio.ensure_future(agent.select_action(self.game))
+                    pending_for = (self.game.current_team, self.game.turn)
+                    requested = time.perf_counter()
+                elif pending.done() or (deadline is not None and time.perf_counter() - requested > deadline):
+                    # An agent which failed or missed the deadline ends the turn
+                    action = END_TURN
+                    if pending.done() and not pending.cancelled() and pending.exception() is None:
+                        action = pending.result()
+                    pending.cancel()
+                    pending = None
+                    if action.type == ActionType.END_TURN or not self.game.apply(action):
+                        self.game.apply(END_TURN)
+            self.draw_frame()
+            # Clock.tick would block the event loop, so the limiter sleeps through asyncio instead
+            await asyncio.sleep(self.frame_delay(frame_start))
         
\ No newline at end of file
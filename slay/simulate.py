@@ -0,0 +1,60 @@
+'''
+Headless games: agents play through the Game action API without a renderer, so nothing here
+imports pygame. Run as a script to measure how many games per second can be simulated.
+'''
+
+from typing import Dict, Sequence
+from map import Map
+from game import Game
+from agent import Agent, RandomAgent
+from action import ActionType
+import argparse
+import time
+import numpy as np
+
+def play_turn(game: Game, agent: Agent, max_actions: int = 100) -> int:
+    # Let the agent act until it ends its turn, returns the number of accepted actions
+    accepted = 0
+    for _ in range(max_actions):
+        action = agent.select_action(game)
+        if action.type == ActionType.END_TURN:
+            break
+        accepted += game.apply(action)
+    game.end_turn()
+    return accepted
+
+def play_game(game: Game, agents: Sequence[Agent], max_turns: int = 100, max_actions: int = 100) -> int:
+    # Play until one team is left or max_turns full rounds were played. Returns the winning team,
+    # or None if the game was not decided.
+    while not game.is_over() and game.turn < max_turns:
+        play_turn(game, agents[game.current_team], max_actions)
+    return game.get_winner()
+
+def make_random_game(size=(20, 10), num_players: int = 3, seed: int = None) -> Game:
+    np.random.seed(seed)
+    map = Map(land_points=15, sea_points=15, size=size)
+    map.make_map(np.random.default_rng(seed))
+    return Game(map, num_players=num_players)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Simulate games between random agents")
+    parser.add_argument("--games", type=int, default=20)
+    parser.add_argument("--rows", type=int, default=20)
+    parser.add_argument("--cols", type=int, default=10)
+    parser.add_argument("--players", type=int, default=3)
+    parser.add_argument("--max-turns", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    winners: Dict[int, int] = {}
+    turns = 0
+    start = time.perf_counter()
+    for index in range(args.games):
+        game = make_random_game((args.rows, args.cols), args.players, args.seed + index)
+        agents = [RandomAgent(seed=args.seed + index * args.players + team) for team in range(args.players)]
+        winner = play_game(game, agents, max_turns=args.max_turns)
+        winners[winner] = winners.get(winner, 0) + 1
+        turns += game.turn
+    elapsed = time.perf_counter() - start
+    print(f"Played {args.games} games ({turns} rounds) in {elapsed:.2f}s, {args.games/elapsed:.2f} games/s")
+    print(f"Winners: {winners}")
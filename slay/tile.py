@@ -1,20 +1,43 @@
 from abc import ABC, abstractmethod
-from typing import List, Tuple
+from typing import List, NamedTuple, Tuple
 from enum import Enum
+from math import sqrt
+import numpy as np
 
 class TileType(Enum):
     HEXAGON = "hexagon"
 
+class TileGeometry(NamedTuple):
+    '''
+    Screen geometry of every tile of a board on a grid, indexed by flat cell index.
+    '''
+    vertices: np.ndarray # (N, k, 2) corners of each tile's polygon
+    centers: np.ndarray  # (N, 2)
+    edges: np.ndarray    # (N, k, 2, 2) ends of the edge towards each neighbor, in neighbor table order
+
 class Tile(ABC):
+    '''
+    A tile is a view onto a single cell of a Board. It holds no state of its own, so tiles are
+    cheap to create on demand and any change made through a tile is written to the board arrays.
+    '''
 
-    def __init__(self, coords: Tuple[int, int] = (0, 0), 
-                       active: bool = True, 
-                       team: int = -1,
-                       region_id: int = None):
+    def __init__(self, board, coords: Tuple[int, int] = (0, 0)):
+        self.board = board
         self.tile_coords = coords # coordinates are (row, col)
-        self.active = active
-        self.team = team
-        self.region_id = region_id
+        self.index = board.index(coords)
+
+    @property
+    def active(self) -> bool:
+        return bool(self.board.active[self.index])
+
+    @property
+    def team(self) -> int:
+        return int(self.board.team[self.index])
+
+    @property
+    def region_id(self) -> int:
+        region_id = int(self.board.region_id[self.index])
+        return None if region_id == self.board.NO_REGION else region_id
     
     @abstractmethod
     def get_grid_coords(self) -> Tuple[int, int]:
@@ -32,25 +55,52 @@ class Tile(ABC):
         # Get coordinates of neighboring tiles in tile coordinate space
         pass
 
+    @classmethod
+    @abstractmethod
+    def make_neighbor_table(cls, size: Tuple[int, int]) -> np.ndarray:
+        # Build an (N, k) array of flat neighbor indices for every cell of a board with the given
+        # size, where -1 marks a neighbor which lies off the board
+        pass
+
+    @classmethod
+    @abstractmethod
+    def make_geometry(cls, size: Tuple[int, int], grid) -> TileGeometry:
+        # Polygon, center and edges of every cell of a board with the given size, drawn on grid
+        pass
+
+    @classmethod
+    @abstractmethod
+    def pick_indices(cls, size: Tuple[int, int], grid, points: np.ndarray) -> np.ndarray:
+        # Flat index of the cell under each of the (K, 2) screen points, -1 where there is none
+        pass
+
     @abstractmethod
     def get_edge_from_neighbor_from_grid(self, neighbor_coord: Tuple[int, int], grid, top_left=(0, 0), use_grid=True) -> Tuple[Tuple[int, int], Tuple[int, int]]:
         # Get the ends of the edge bordering between the current tile and the given neighboring tile
         pass
 
+    @abstractmethod
+    def get_edge_from_direction_from_grid(self, direction: int, grid, top_left=(0, 0), use_grid=True) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+        # Same as above, but the neighbor is given by its column in the board's neighbor table
+        pass
+
     def get_tile_coords(self) -> Tuple[int, int]:
         return self.tile_coords
 
     def set_activity(self, active: bool=True) -> None:
-        self.active = active
+        self.board.active[self.index] = active
 
     def set_team(self, team: int=-1) -> None:
+        self.board.journal.record(self.set_team, self.team)
         if self.is_active():
-            self.team = team
+            self.board.team[self.index] = team
         else:
-            self.team = -1
+            self.board.team[self.index] = -1
+        self.board.touch(self.index)
 
     def set_region_id(self, region_id: int) -> None:
-        self.region_id = region_id
+        self.board.journal.record(self.set_region_id, self.region_id)
+        self.board.region_id[self.index] = self.board.NO_REGION if region_id is None else region_id
             
     def get_team(self) -> int:
         return self.team
@@ -64,6 +114,9 @@ class Tile(ABC):
     def get_edge_from_neighbor(self, neighbor_coord: Tuple[int, int], grid):
         return self.get_edge_from_neighbor_from_grid(neighbor_coord, grid, self.get_grid_coords(), use_grid=True)
 
+    def get_edge_from_direction(self, direction: int, grid):
+        return self.get_edge_from_direction_from_grid(direction, grid, self.get_grid_coords(), use_grid=True)
+
     def is_neighbor(self, tile: 'Tile') -> bool:
         return tile.get_tile_coords() in self.get_neighbors_coords()
 
@@ -83,16 +136,71 @@ class Tile(ABC):
 
 class Hexagon(Tile):
 
-    def __init__(self, coords: Tuple[int, int] = (0, 0), 
-                       active: bool = True, 
-                       team: int = -1,
-                       region_id = None):
-        super().__init__(coords=coords, active=active, team=team, region_id=region_id)
+    EVEN_ROW_OFFSETS = ((-2, 0), (-1, 0), (1, 0), (2, 0), (1, -1), (-1, -1))
+    ODD_ROW_OFFSETS = ((-2, 0), (-1, 1), (1, 1), (2, 0), (1, 0), (-1, 0))
+    # Corners and center on the grid, relative to the grid coordinates of the tile
+    EVEN_ROW_VERTICES = ((0, 0), (0, 1), (1, 1), (2, 1), (2, 0), (1, -1))
+    ODD_ROW_VERTICES = ((0, 0), (0, 1), (1, 2), (2, 1), (2, 0), (1, 0))
+    EVEN_ROW_CENTER = (1, 0)
+    ODD_ROW_CENTER = (1, 1)
+
+    @property
+    def relative_coords(self) -> Tuple[Tuple[int, int], ...]:
         if self.tile_coords[0] % 2 == 0:
-            self.relative_coords = [(-2, 0), (-1, 0), (1, 0), (2, 0), (1, -1), (-1, -1)]
+            return Hexagon.EVEN_ROW_OFFSETS
         else:
-            self.relative_coords = [(-2, 0), (-1, 1), (1, 1), (2, 0), (1, 0), (-1, 0)]
-        
+            return Hexagon.ODD_ROW_OFFSETS
+
+    @classmethod
+    def make_neighbor_table(cls, size: Tuple[int, int]) -> np.ndarray:
+        rows, cols = size
+        row, col = np.divmod(np.arange(rows * cols), cols)
+        offsets = np.where((row % 2 == 0)[:, None, None],
+                           np.array(cls.EVEN_ROW_OFFSETS),
+                           np.array(cls.ODD_ROW_OFFSETS))
+        neighbor_row = row[:, None] + offsets[..., 0]
+        neighbor_col = col[:, None] + offsets[..., 1]
+        on_board = (neighbor_row >= 0) & (neighbor_row < rows) & (neighbor_col >= 0) & (neighbor_col < cols)
+        return np.where(on_board, neighbor_row * cols + neighbor_col, -1)
+
+    @classmethod
+    def make_geometry(cls, size: Tuple[int, int], hex_grid) -> TileGeometry:
+        rows, cols = size
+        row, col = np.divmod(np.arange(rows * cols), cols)
+        odd = (row % 2 == 1)
+        grid_col = 1 + col*3 + odd
+        vertex_offsets = np.where(odd[:, None, None], np.array(cls.ODD_ROW_VERTICES), np.array(cls.EVEN_ROW_VERTICES))
+        center_offsets = np.where(odd[:, None], np.array(cls.ODD_ROW_CENTER), np.array(cls.EVEN_ROW_CENTER))
+        vertices = hex_grid.get_many(np.stack([row, grid_col], axis=-1)[:, None, :] + vertex_offsets)
+        centers = hex_grid.get_many(np.stack([row, grid_col], axis=-1) + center_offsets)
+        # The edge towards neighbor k runs from corner k to corner k+1
+        edges = np.stack([vertices, np.roll(vertices, -1, axis=1)], axis=2)
+        return TileGeometry(vertices, centers, edges)
+
+    @classmethod
+    def pick_indices(cls, size: Tuple[int, int], hex_grid, points: np.ndarray) -> np.ndarray:
+        # Tiles are flat topped hexagons with sides of length scale. Their centers lie at
+        # x = left + scale*(1.5 + 3*col + 1.5*(row % 2)), y = top + scale*sqrt(3)/2*(row + 1), so
+        # (2*col + row % 2, row) are doubled coordinates and a point is converted to axial
+        # coordinates (q, r) relative to the center of tile (0, 0) and rounded to the nearest hexagon.
+        rows, cols = size
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        x = (points[:, 0] - hex_grid.top_left[0]) / hex_grid.scale - 1.5
+        y = (points[:, 1] - hex_grid.top_left[1]) / hex_grid.scale - sqrt(3)/2
+        q = 2/3 * x
+        r = -x/3 + y/sqrt(3)
+        s = -q - r
+        # Round in cube coordinates, fixing the coordinate with the largest rounding error
+        round_q, round_r, round_s = np.round(q), np.round(r), np.round(s)
+        error_q, error_r, error_s = np.abs(round_q - q), np.abs(round_r - r), np.abs(round_s - s)
+        fix_q = (error_q > error_r) & (error_q > error_s)
+        fix_r = ~fix_q & (error_r > error_s)
+        round_q = np.where(fix_q, -round_r - round_s, round_q)
+        round_r = np.where(fix_r, -round_q - round_s, round_r)
+        row = (2*round_r + round_q).astype(np.int64)
+        col = (round_q.astype(np.int64) - row % 2) // 2
+        on_board = (row >= 0) & (row < rows) & (col >= 0) & (col < cols)
+        return np.where(on_board, row * cols + col, -1)
 
     def get_grid_coords(self):
         row, col = self.tile_coords
@@ -100,11 +208,9 @@ class Hexagon(Tile):
 
     def get_shape_from_grid(self, hex_grid, top_left=(0, 0), use_grid=True):
         if top_left[0] % 2 == 0:
-            vertices = [[0, 0], [0, 1], [1, 1], [2, 1], [2, 0], [1, -1]]
-            center = [1, 0]
+            vertices, center = Hexagon.EVEN_ROW_VERTICES, Hexagon.EVEN_ROW_CENTER
         else:
-            vertices = [[0, 0], [0, 1], [1, 2], [2, 1], [2, 0], [1, 0]]
-            center = [1, 1]
+            vertices, center = Hexagon.ODD_ROW_VERTICES, Hexagon.ODD_ROW_CENTER
         vertices = [[vertex[0] + top_left[0], vertex[1] + top_left[1]] for vertex in vertices]
         center = [top_left[0]+center[0], top_left[1] + center[1]]
 
@@ -116,12 +222,14 @@ class Hexagon(Tile):
     def get_edge_from_neighbor_from_grid(self, neighbor_coord: Tuple[int, int], hex_grid, top_left=(0, 0), use_grid=True) -> Tuple[Tuple[float, float], Tuple[float, float]]:
         #NOTE: Does not check if neighbor_coord is actually a neighbor
         relative_coord = (neighbor_coord[0] - self.tile_coords[0], neighbor_coord[1] - self.tile_coords[1])
-        neighbor_index = self.relative_coords.index(relative_coord
-        )
+        neighbor_index = self.relative_coords.index(relative_coord)
+        return self.get_edge_from_direction_from_grid(neighbor_index, hex_grid, top_left, use_grid)
+
+    def get_edge_from_direction_from_grid(self, neighbor_index: int, hex_grid, top_left=(0, 0), use_grid=True) -> Tuple[Tuple[float, float], Tuple[float, float]]:
         if top_left[0] % 2 == 0:
-            vertices = [(0, 0), (0, 1), (1, 1), (2, 1), (2, 0), (1, -1)]
+            vertices = Hexagon.EVEN_ROW_VERTICES
         else:
-            vertices = [(0, 0), (0, 1), (1, 2), (2, 1), (2, 0), (1, 0)]
+            vertices = Hexagon.ODD_ROW_VERTICES
         if neighbor_index == (len(vertices) - 1):
             edge = ((vertices[-1], vertices[0]))
         else:
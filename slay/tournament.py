@@ -0,0 +1,239 @@
+'''
+Tournaments between Agent implementations. Matches run across a process pool, and only small
+specs travel between processes: every worker builds the agents from an AgentSpec and generates
+the map of a match from its seed, and sends back a small result record. Results are appended
+to a JSON lines file as soon as each game finishes, and the standings (win rates, Elo, game
+length and time per move) are written next to it at the end.
+
+Round robin plays every ordered pair of agents on every map and seed, so both agents get to
+move first. Swiss plays a fixed number of rounds, each pairing agents with equal scores that
+have not met yet.
+'''
+
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from tile import TileType
+from map import Map
+from mapgen import MapGenerator, map_rng
+from game import Game
+from action import ActionType
+import importlib
+import inspect
+import json
+import math
+import time
+import numpy as np
+
+class AgentSpec(NamedTuple):
+    '''
+    Everything needed to build an agent in another process.
+    '''
+    name: str
+    class_name: str
+    module: str = "agent"
+    kwargs: dict = None
+
+    def build(self, seed: int = None):
+        agent_type = getattr(importlib.import_module(self.module), self.class_name)
+        kwargs = dict(self.kwargs or {})
+        if "seed" in inspect.signature(agent_type).parameters:
+            kwargs.setdefault("seed", seed)
+        return agent_type(**kwargs)
+
+class GameSettings(NamedTuple):
+    size: Tuple[int, int] = (20, 10)
+    land_points: int = 15
+    sea_points: int = 15
+    tile_type: TileType = TileType.HEXAGON
+    base_seed: int = 0
+    max_turns: int = 50
+    max_actions: int = 100
+
+class MatchSpec(NamedTuple):
+    match_id: int
+    round: int
+    seats: Tuple[int, ...] # Index of the agent playing each team
+    map_index: int
+    seed: int
+
+# Every worker keeps one map generator per game settings
+generators: Dict[GameSettings, MapGenerator] = {}
+
+def play_match(match: MatchSpec, agents: Sequence[AgentSpec], settings: GameSettings) -> dict:
+    generator = generators.get(settings)
+    if generator is None:
+        generator = MapGenerator(size=settings.size, land_points=settings.land_points,
+                                 sea_points=settings.sea_points, tile_type=settings.tile_type)
+        generators[settings] = generator
+    map = Map(land_points=settings.land_points, sea_points=settings.sea_points, size=settings.size, tile_type=settings.tile_type)
+    map.generator = generator
+    map.board.active[:] = generator.generate(map_rng(settings.base_seed, match.map_index))
+    np.random.seed([match.seed, match.map_index])
+    game = Game(map, num_players=len(match.seats))
+    players = [agents[agent].build(seed=int(np.random.SeedSequence([match.seed, match.map_index, team]).generate_state(1)[0]))
+               for team, agent in enumerate(match.seats)]
+
+    thinking = [0.0] * len(players)
+    moves = [0] * len(players)
+    start = time.perf_counter()
+    while not game.is_over() and game.turn < settings.max_turns:
+        team = game.current_team
+        for _ in range(settings.max_actions):
+            before = time.perf_counter()
+            action = players[team].select_action(game)
+            thinking[team] += time.perf_counter() - before
+            moves[team] += 1
+            if action.type == ActionType.END_TURN:
+                break
+            game.apply(action)
+        game.end_turn()
+    winner = game.get_winner()
+    return {"match_id": match.match_id,
+            "round": match.round,
+            "map_index": match.map_index,
+            "seed": match.seed,
+            "seats": [agents[agent].name for agent in match.seats],
+            "winner": None if winner is None else agents[match.seats[winner]].name,
+            "turns": game.turn,
+            "moves": moves,
+            "time_per_move": [thinking[team] / max(moves[team], 1) for team in range(len(players))],
+            "seconds": time.perf_counter() - start}
+
+class Standings:
+    '''
+    Scores, Elo ratings and game statistics of every agent. Elo is updated game by game in
+    match order, so it does not depend on the order games finished in.
+    '''
+
+    def __init__(self, names: Sequence[str], k: float = 16, initial_elo: float = 1500):
+        self.names = list(names)
+        self.k = k
+        self.initial_elo = initial_elo
+        self.results: List[dict] = []
+
+    def add(self, result: dict) -> None:
+        self.results.append(result)
+
+    def scores(self) -> Dict[str, float]:
+        scores = {name: 0.0 for name in self.names}
+        for result in self.results:
+            for name in result["seats"]:
+                scores[name] += 1.0 if result["winner"] == name else 0.5 if result["winner"] is None else 0.0
+        return scores
+
+    def played(self) -> set:
+        return set(tuple(sorted(result["seats"])) for result in self.results)
+
+    def elo(self) -> Dict[str, float]:
+        ratings = {name: self.initial_elo for name in self.names}
+        for result in sorted(self.results, key=lambda result: result["match_id"]):
+            first, second = result["seats"][:2]
+            expected = 1 / (1 + 10 ** ((ratings[second] - ratings[first]) / 400))
+            score = 1.0 if result["winner"] == first else 0.0 if result["winner"] == second else 0.5
+            ratings[first] += self.k * (score - expected)
+            ratings[second] -= self.k * (score - expected)
+        return ratings
+
+    def summary(self) -> List[dict]:
+        elo = self.elo()
+        rows = []
+        for name in self.names:
+            games = [result for result in self.results if name in result["seats"]]
+            wins = sum(result["winner"] == name for result in games)
+            draws = sum(result["winner"] is None for result in games)
+            moves = sum(result["moves"][result["seats"].index(name)] for result in games)
+            thinking = sum(result["time_per_move"][result["seats"].index(name)] * result["moves"][result["seats"].index(name)] for result in games)
+            rows.append({"name": name,
+                         "games": len(games),
+                         "wins": wins,
+                         "draws": draws,
+                         "losses": len(games) - wins - draws,
+                         "win_rate": wins / len(games) if games else 0.0,
+                         "elo": elo[name],
+                         "mean_turns": float(np.mean([result["turns"] for result in games])) if games else 0.0,
+                         "time_per_move": thinking / moves if moves else 0.0})
+        return sorted(rows, key=lambda row: -row["elo"])
+
+def round_robin(num_agents: int, num_maps: int, seeds: Sequence[int]) -> List[MatchSpec]:
+    matches = []
+    for seed in seeds:
+        for map_index in range(num_maps):
+            for first in range(num_agents):
+                for second in range(num_agents):
+                    if first != second:
+                        matches.append(MatchSpec(len(matches), 0, (first, second), map_index, seed))
+    return matches
+
+def swiss_pairings(standings: Standings) -> List[Tuple[int, int]]:
+    # Pair agents in order of score, each with the best placed agent it has not played yet. With an
+    # odd number of agents, the lowest placed agent sits the round out.
+    scores = standings.scores()
+    played = standings.played()
+    order = sorted(range(len(standings.names)), key=lambda agent: -scores[standings.names[agent]])
+    pairs = []
+    while len(order) > 1:
+        first = order.pop(0)
+        fresh = [agent for agent in order if tuple(sorted((standings.names[first], standings.names[agent]))) not in played]
+        second = fresh[0] if fresh else order[0]
+        order.remove(second)
+        pairs.append((first, second))
+    return pairs
+
+def run_matches(matches: Sequence[MatchSpec], agents: Sequence[AgentSpec], settings: GameSettings,
+                standings: Standings, out, workers: int = None) -> None:
+    # Play the matches and stream each result to out as soon as it is in
+    def record(result: dict) -> None:
+        standings.add(result)
+        out.write(json.dumps(result) + "\n")
+        out.flush()
+
+    if workers == 1:
+        for match in matches:
+            record(play_match(match, agents, settings))
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(play_match, match, agents, settings) for match in matches]
+        for future in as_completed(futures):
+            record(future.result())
+
+def run_tournament(agents: Sequence[AgentSpec], out_path: str,
+                   num_maps: int = 4,
+                   seeds: Sequence[int] = (0,),
+                   format: str = "round_robin",
+                   rounds: int = None,
+                   settings: GameSettings = GameSettings(),
+                   workers: int = None) -> List[dict]:
+    # Results go to out_path as JSON lines, the final standings to out_path with a .summary.json
+    # suffix. Returns the standings.
+    if len(set(agent.name for agent in agents)) != len(agents):
+        raise ValueError("Every agent of a tournament needs a different name!")
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    standings = Standings([agent.name for agent in agents])
+    with open(out_path, "w") as out:
+        if format == "round_robin":
+            run_matches(round_robin(len(agents), num_maps, seeds), agents, settings, standings, out, workers)
+        elif format == "swiss":
+            rounds = rounds or math.ceil(math.log2(max(len(agents), 2))) + 1
+            match_id = 0
+            for round_index in range(rounds):
+                matches = []
+                for first, second in swiss_pairings(standings):
+                    for seed in seeds:
+                        for map_index in range(round_index * num_maps, (round_index + 1) * num_maps):
+                            for seats in [(first, second), (second, first)]:
+                                matches.append(MatchSpec(match_id, round_index, seats, map_index, seed))
+                                match_id += 1
+                run_matches(matches, agents, settings, standings, out, workers)
+        else:
+            raise ValueError(f"Unknown tournament format {format}!")
+    summary = standings.summary()
+    with open(out_path.with_suffix(".summary.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+if __name__ == '__main__':
+    agents = [AgentSpec("random_a", "RandomAgent"), AgentSpec("random_b", "RandomAgent"), AgentSpec("passive", "Agent")]
+    for row in run_tournament(agents, "tournament/results.jsonl", num_maps=2, settings=GameSettings(max_turns=20)):
+        print(row)
@@ -0,0 +1,150 @@
+'''
+Zobrist hashing of game positions and a bounded transposition table keyed by the hash.
+
+A position hashes to the XOR of one random 64 bit key per (cell, team) pair, one per
+(cell, piece kind) pair and one for the team to move. Changing a cell only swaps that cell's
+keys, so the board keeps its hash up to date in Board.touch at O(1) cost per change. Only the
+keys for the team to move have the top bit set, so the hash of a position is never 0, which
+the transposition table uses to mark empty entries.
+'''
+
+from enum import Enum
+from piece import PIECE_TYPES
+import numpy as np
+
+DEFAULT_SEED = 0x5A1
+
+class ZobristKeys:
+    '''
+    Random keys for boards of one size. The keys only depend on the seed and the board size, so
+    hashes from different processes or self-play logs can be compared directly.
+    '''
+
+    def __init__(self, num_cells: int, num_teams: int, seed: int = DEFAULT_SEED):
+        rng = np.random.default_rng([num_cells, num_teams, seed])
+        high = np.iinfo(np.uint64).max
+        top = np.uint64(1 << 63)
+        # Team -1 (no team) is stored in the first column
+        self.team = rng.integers(high, size=(num_cells, num_teams + 1), dtype=np.uint64, endpoint=True) & ~top
+        self.piece = rng.integers(high, size=(num_cells, max(PIECE_TYPES) + 1), dtype=np.uint64, endpoint=True) & ~top
+        self.piece[:, 0] = 0 # An empty cell only contributes its team key
+        self.side = rng.integers(high, size=num_teams, dtype=np.uint64, endpoint=True) | top
+
+    def cell_keys(self, team: np.ndarray, piece: np.ndarray) -> np.ndarray:
+        # Key of every cell for the given (..., N) team and piece arrays
+        cells = np.arange(team.shape[-1])
+        return self.team[cells, team.astype(np.int64) + 1] ^ self.piece[cells, piece]
+
+    def hash_cells(self, team: np.ndarray, piece: np.ndarray, side: np.ndarray = None) -> np.ndarray:
+        # Hashes of a batch of positions, e.g. the records of a map archive, as a (...) uint64 array
+        hashes = np.bitwise_xor.reduce(self.cell_keys(team, piece), axis=-1)
+        if side is not None:
+            hashes = hashes ^ self.side[side]
+        return hashes
+
+class ReplacementPolicy(Enum):
+    ALWAYS = "always"       # A new entry always replaces the old one
+    DEPTH = "depth"         # Keep the entry searched deeper, unless it is from an older search
+    TWO_TIER = "two_tier"   # Every bucket has a depth preferred slot and an always replaced slot
+
+class Bound(Enum):
+    EXACT = 0
+    LOWER = 1
+    UPPER = 2
+
+ENTRY_DTYPE = np.dtype([("key", "<u8"),
+                        ("value", "<f4"),
+                        ("move", "<i4"),
+                        ("depth", "<i2"),
+                        ("bound", "u1"),
+                        ("generation", "u1")])
+
+class TranspositionTable:
+    '''
+    Fixed size table of search results keyed by Zobrist hash. All entries live in one
+    preallocated array sized to the memory limit, with two slots per bucket. When a bucket is
+    full, the replacement policy decides which entry gives way. An entry with key 0 is empty, so
+    keys are position hashes including the team to move, which are never 0.
+    '''
+
+    def __init__(self, memory_limit: int = 64 * 2**20, policy: ReplacementPolicy = ReplacementPolicy.TWO_TIER):
+        buckets = memory_limit // (2 * ENTRY_DTYPE.itemsize)
+        if buckets < 1:
+            raise ValueError(f"Memory limit of {memory_limit} bytes is too small for a transposition table!")
+        self.num_buckets = 1 << (int(buckets).bit_length() - 1) # Round down to a power of two
+        self.entries = np.zeros((self.num_buckets, 2), dtype=ENTRY_DTYPE)
+        self.policy = policy
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return int(np.count_nonzero(self.entries["key"]))
+
+    def memory_usage(self) -> int:
+        return self.entries.nbytes
+
+    def clear(self) -> None:
+        self.entries[:] = 0
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def new_search(self) -> None:
+        # Entries from earlier searches are replaced first by the depth preferring policies
+        self.generation = (self.generation + 1) % 256
+
+    def bucket(self, key: int) -> np.ndarray:
+        return self.entries[key & (self.num_buckets - 1)]
+
+    def probe(self, key: int):
+        # Returns (value, move, depth, bound) for the position, or None if it is not stored. When
+        # both slots hold the position, the always replaced slot has the newer result.
+        key = int(key)
+        bucket = self.bucket(key)
+        for slot in (1, 0):
+            if bucket["key"][slot] == key:
+                self.hits += 1
+                entry = bucket[slot]
+                return float(entry["value"]), int(entry["move"]), int(entry["depth"]), Bound(int(entry["bound"]))
+        self.misses += 1
+        return None
+
+    def choose_slot(self, bucket: np.ndarray, key: int, depth: int) -> int:
+        # The slot the new entry goes into, or -1 if it should not be stored
+        keys = bucket["key"]
+        for slot in range(2):
+            if keys[slot] == key:
+                if self.policy == ReplacementPolicy.DEPTH and depth < bucket["depth"][slot] \
+                        and bucket["generation"][slot] == self.generation:
+                    return -1 # Keep the deeper result for the position
+                if self.policy == ReplacementPolicy.TWO_TIER and slot == 0 and depth < bucket["depth"][0] \
+                        and bucket["generation"][0] == self.generation:
+                    return 1 # Keep the deeper result and store the new one in the always replaced slot
+                if slot == 0 and keys[1] == key:
+                    bucket[1] = (0, 0, 0, 0, 0, 0) # Drop the older copy of the position
+                return slot
+        if self.policy == ReplacementPolicy.ALWAYS:
+            if keys[0] != 0:
+                bucket[1] = bucket[0] # Keep the previous entry until the next one arrives
+            return 0
+        stale = bucket["generation"][0] != self.generation
+        if keys[0] == 0 or stale or depth >= bucket["depth"][0]:
+            if self.policy == ReplacementPolicy.TWO_TIER and keys[0] != 0:
+                bucket[1] = bucket[0] # The old entry moves down to the always replaced slot
+            return 0
+        if self.policy == ReplacementPolicy.TWO_TIER:
+            return 1
+        return 1 if keys[1] == 0 or bucket["generation"][1] != self.generation or depth >= bucket["depth"][1] else -1
+
+    def store(self, key: int, value: float, move: int = -1, depth: int = 0, bound: Bound = Bound.EXACT) -> bool:
+        # Returns whether the entry was stored
+        key = int(key)
+        if key == 0:
+            raise ValueError("Key 0 marks empty entries, store positions by their full hash!")
+        bucket = self.bucket(key)
+        slot = self.choose_slot(bucket, key, depth)
+        if slot < 0:
+            return False
+        bucket[slot] = (key, value, move, depth, bound.value, self.generation)
+        return True